@@ -0,0 +1,204 @@
+"""
+Catalog JSON API (v1)
+Read-only JSON over the car catalog and availability for the mobile app.
+
+    GET /api/v1/cars                       newest first, same filters as /cars
+    GET /api/v1/cars/<id>
+    GET /api/v1/cars/<id>/availability?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD
+    GET /api/v1/cars/<id>/calendar         booked days over the next year
+
+Queries select only the serialized columns, so no Car objects are built.
+Every response has a strong ETag: for cars it is derived from the id and
+updated_at of each car in the response, so it changes exactly when one of
+them is edited. A request whose If-None-Match matches gets an empty 304.
+Car responses may be cached by clients and CDNs for API_CACHE_MAX_AGE
+seconds; availability must always be revalidated. The calendar, which only
+guides the date picker (book_car checks again), may be reused for
+CALENDAR_CACHE_MAX_AGE seconds.
+"""
+import base64
+import hashlib
+import os
+from datetime import date
+
+from flask import Blueprint, current_app, jsonify, request, url_for
+
+from models import db, Car
+from availability import availability, filter_available, CALENDAR_DAYS
+from images import car_images
+from pagination import KeysetPagination
+from pricing import pricing
+from queries import CAR_KEY
+from replicas import read_only
+from search import car_search
+
+API_VERSION = 'v1'
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+LIST_COLUMNS = (
+    Car.id, Car.brand, Car.model, Car.category, Car.seat_capacity, Car.price_per_day,
+    Car.fuel_type, Car.transmission, Car.year, Car.is_available, Car.image_url,
+    Car.created_at, Car.updated_at,
+)
+DETAIL_COLUMNS = LIST_COLUMNS + (Car.description,)
+
+
+def serialize_car(row):
+    data = {
+        'id': row.id,
+        'brand': row.brand,
+        'model': row.model,
+        'category': row.category,
+        'seat_capacity': row.seat_capacity,
+        'price_per_day': row.price_per_day,
+        'fuel_type': row.fuel_type,
+        'transmission': row.transmission,
+        'year': row.year,
+        'is_available': bool(row.is_available),
+        'image': image_url(row),
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None,
+    }
+    if 'description' in row._fields:
+        data['description'] = row.description
+    return data
+
+
+def image_url(row):
+    filename = os.path.basename(row.image_url or '') or 'default-car.jpg'
+    return url_for('static', filename=car_images.resolve(row.brand, row.model, filename), _external=True)
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr((API_VERSION,) + parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+
+def conditional(etag, build, cache_control):
+    """304 when the client already has etag, else the JSON from build()."""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def error(status, message):
+    response = jsonify({'error': message})
+    response.status_code = status
+    return response
+
+
+def _public_cache_control():
+    return f"public, max-age={current_app.config.get('API_CACHE_MAX_AGE', 60)}"
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    return date.fromisoformat(value) if value else None
+
+
+@api_v1.route('/cars')
+@read_only
+def list_cars():
+    try:
+        start_date, end_date = _date_arg('start_date'), _date_arg('end_date')
+    except ValueError:
+        return error(400, 'start_date and end_date must be YYYY-MM-DD')
+    if bool(start_date) != bool(end_date) or (start_date and end_date <= start_date):
+        return error(400, 'give both start_date and end_date, with end_date after start_date')
+    limit = min(max(request.args.get('limit', current_app.config.get('API_PAGE_SIZE', 20), type=int), 1),
+                current_app.config.get('API_MAX_PAGE_SIZE', 100))
+    text = request.args.get('query', '').strip()
+    category = request.args.get('category', '')
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+
+    query = db.session.query(*LIST_COLUMNS)
+    if request.args.get('show_all', '').lower() != 'true':
+        query = query.filter(Car.is_available == True)
+    if category:
+        query = query.filter(Car.category == category)
+    if min_price:
+        query = query.filter(Car.price_per_day >= min_price)
+    if max_price:
+        query = query.filter(Car.price_per_day <= max_price)
+    if start_date:
+        query = filter_available(query, start_date, end_date)
+
+    if text:
+        # Relevance order: page by number like the HTML search results
+        page = max(request.args.get('page', 1, type=int), 1)
+        rows = car_search.filter(query, text).limit(limit + 1).offset((page - 1) * limit).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        paging = {'next_page': page + 1 if more else None}
+    else:
+        pagination = KeysetPagination(
+            per_page=limit, max_per_page=None, error_out=False, count=False,
+            query=query, columns=CAR_KEY, key=lambda row: (row.created_at, row.id),
+            cursor=request.args.get('cursor')
+        )
+        rows = pagination.items
+        paging = {'next_cursor': pagination.next_cursor}
+
+    etag = make_etag(sorted(request.args.items(multi=True)),
+                     [(row.id, row.updated_at) for row in rows], paging)
+    return conditional(etag, lambda: dict(data=[serialize_car(row) for row in rows], **paging),
+                       _public_cache_control())
+
+
+@api_v1.route('/cars/<int:car_id>')
+@read_only
+def get_car(car_id):
+    row = db.session.query(*DETAIL_COLUMNS).filter(Car.id == car_id).first()
+    if row is None:
+        return error(404, 'car not found')
+    return conditional(make_etag(row.id, row.updated_at), lambda: {'data': serialize_car(row)},
+                       _public_cache_control())
+
+
+@api_v1.route('/cars/<int:car_id>/availability')
+@read_only
+def car_availability(car_id):
+    try:
+        start_date, end_date = _date_arg('start_date'), _date_arg('end_date')
+    except ValueError:
+        return error(400, 'start_date and end_date must be YYYY-MM-DD')
+    if not start_date or not end_date or end_date <= start_date:
+        return error(400, 'give both start_date and end_date, with end_date after start_date')
+    row = db.session.query(Car.id, Car.is_available, Car.price_per_day, Car.category)\
+        .filter(Car.id == car_id).first()
+    if row is None:
+        return error(404, 'car not found')
+
+    conflict = availability.find_conflict(car_id, start_date, end_date)
+    payload = {'data': {
+        'car_id': car_id,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'is_available': bool(row.is_available),
+        'free': conflict is None,
+        'total_price': pricing.quote(row.price_per_day, row.category, start_date, end_date),
+    }}
+    return conditional(make_etag(payload), lambda: payload, 'no-cache')
+
+
+@api_v1.route('/cars/<int:car_id>/calendar')
+@read_only
+def car_calendar(car_id):
+    """Bit i of the base64 ``booked`` bitset (byte i // 8, lowest bit first)
+    is set when day ``start`` + i is covered by a pending or approved booking."""
+    if db.session.query(Car.id).filter(Car.id == car_id).first() is None:
+        return error(404, 'car not found')
+    first_day, bits = availability.calendar(car_id)
+    payload = {'data': {
+        'car_id': car_id,
+        'start': first_day.isoformat(),
+        'days': CALENDAR_DAYS,
+        'booked': base64.b64encode(bits).decode('ascii'),
+    }}
+    return conditional(make_etag(payload), lambda: payload,
+                       f"public, max-age={current_app.config.get('CALENDAR_CACHE_MAX_AGE', 30)}")
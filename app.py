@@ -1,11 +1,31 @@
-from flask import Flask, render_template, redirect, url_for, flash, request
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from config import Config
 from models import db, User, Car, Booking
+from availability import availability, filter_available
+from images import car_images
+from cache import page_cache
+from dbpool import pool_metrics
+from replicas import replicas, read_only
+from instrumentation import instrumentation
+from ratelimit import limiter
+from identity import user_cache
+import reports
+import migrations
+import fleet
+import approvals
+import reservations
+from lifecycle import lifecycle
+from pricing import pricing
+from search import car_search
+from pagination import paginate, page_link_args
+import exports
+from api import api_v1
+from queries import (bookings_with_details, bookings_with_car, customers_with_booking_counts,
+                     BOOKING_KEY, CAR_KEY, CUSTOMER_KEY)
 from forms import RegistrationForm, LoginForm, CarForm, BookingForm, SearchForm
 from werkzeug.utils import secure_filename
-from datetime import datetime, date
-from sqlalchemy import or_, and_
+from datetime import datetime, date, timedelta
 import os
 
 app = Flask(__name__)
@@ -15,7 +35,22 @@ app.config.from_object(Config)
 app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, app.config.get('UPLOAD_FOLDER', 'static/uploads/cars'))
 
 # Initialize extensions
+pool_metrics.init_app(app)  # before db.init_app, sets the engine's pool class
 db.init_app(app)
+replicas.init_app(app)
+availability.init_app(app)
+page_cache.init_app(app)
+reports.init_app(app)
+car_search.init_app(app)
+migrations.init_app(app)
+fleet.init_app(app)
+approvals.init_app(app)
+lifecycle.init_app(app)
+pricing.init_app(app)
+instrumentation.init_app(app)
+limiter.init_app(app)
+user_cache.init_app(app)
+app.register_blueprint(api_v1)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -23,10 +58,14 @@ login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(user_id)
 
 # Create upload folder if it doesn't exist (absolute path)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+car_images.init_app(app)
+
+
+app.add_template_global(page_link_args)
 
 
 # Template helper: sanitize image filename stored in DB (strip paths/backslashes)
@@ -41,13 +80,13 @@ def image_filename_filter(value):
 
 # Template filter to return the best URL for a car image
 @app.template_filter('car_image')
-def car_image_filter(car):
+def car_image_filter(car, srcset=None):
     """Return a static URL string for the car's image.
 
-    Priority:
-    1. Uploaded image in static/uploads/cars/<filename>
-    2. Branded image in static/img/<brand>-<model>.png or static/img/<brand>.png
-    3. Default image static/img/default-car.jpg
+    Resolution (uploaded image, then branded image, then the default) is
+    served from the in-memory manifest in images.py. With srcset='webp' or
+    srcset='avif' a srcset value of the resized derivatives in that format
+    is returned instead (empty when none have been generated yet).
     """
     # car may be a filename string if called differently - handle both
     try:
@@ -60,34 +99,11 @@ def car_image_filter(car):
         image_value = car
 
     filename = image_filename_filter(image_value)
-
-    # 1) check uploads folder
-    uploads_rel = os.path.join('uploads', 'cars', filename)
-    uploads_abs = os.path.join(app.root_path, 'static', uploads_rel)
-    if filename and os.path.exists(uploads_abs):
-        return url_for('static', filename=uploads_rel)
-
-    # 2) check branded images under static/img
-    def slugify(s):
-        return ''.join(c if c.isalnum() else '-' for c in (s or '').strip().lower()).strip('-')
-
-    candidates = []
-    if brand and model:
-        candidates.append(f"{slugify(brand)}-{slugify(model)}.png")
-        candidates.append(f"{slugify(brand)}-{slugify(model)}.jpg")
-        candidates.append(f"{slugify(brand)}-{slugify(model)}.svg")
-    if brand:
-        candidates.append(f"{slugify(brand)}.png")
-        candidates.append(f"{slugify(brand)}.jpg")
-        candidates.append(f"{slugify(brand)}.svg")
-
-    for cand in candidates:
-        cand_abs = os.path.join(app.root_path, 'static', 'img', cand)
-        if os.path.exists(cand_abs):
-            return url_for('static', filename=f'img/{cand}')
-
-    # 3) fallback to default
-    return url_for('static', filename='img/default-car.jpg')
+    path = car_images.resolve(brand, model, filename)
+    if srcset:
+        return ', '.join(f"{url_for('static', filename=derived)} {width}w"
+                         for width, derived in car_images.srcset(path, srcset))
+    return url_for('static', filename=path)
 
 # Helper functions
 def allowed_file(filename):
@@ -101,17 +117,21 @@ def save_car_image(image_file):
         filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         image_file.save(filepath)
+        car_images.add_upload(filename)
         return filename
     return None
 
 # Routes
 @app.route('/')
+@read_only
+@page_cache.cached(tags=('catalog',))
 def index():
     """Home page with featured cars - shows both available and unavailable cars"""
     featured_cars = Car.query.order_by(Car.created_at.desc()).limit(6).all()
     return render_template('index.html', cars=featured_cars)
 
 @app.route('/register', methods=['GET', 'POST'])
+@limiter.limit('register', 'ip')
 def register():
     """User registration"""
     if current_user.is_authenticated:
@@ -127,12 +147,14 @@ def register():
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
+        reports.invalidate_dashboard()
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('login'))
     
     return render_template('register.html', form=form)
 
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit('login', 'ip', 'email')
 def login():
     """User and admin login"""
     if current_user.is_authenticated:
@@ -162,7 +184,13 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
+def _has_date_filter():
+    # Date-range results depend on bookings, which are not cache tags
+    return bool(request.args.get('start_date') or request.args.get('end_date'))
+
 @app.route('/cars')
+@read_only
+@page_cache.cached(tags=('catalog',), unless=_has_date_filter)
 def cars():
     """Browse all available cars with search and filter"""
     page = request.args.get('page', 1, type=int)
@@ -170,21 +198,14 @@ def cars():
     category = request.args.get('category', '')
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
+    start_date = request.args.get('start_date', type=date.fromisoformat)
+    end_date = request.args.get('end_date', type=date.fromisoformat)
     show_all = request.args.get('show_all', '').lower() == 'true'
     
     # Base query - show all cars or just available ones
     cars_query = Car.query if show_all else Car.query.filter_by(is_available=True)
     
     # Apply filters
-    if query:
-        cars_query = cars_query.filter(
-            or_(
-                Car.brand.ilike(f'%{query}%'),
-                Car.model.ilike(f'%{query}%'),
-                Car.description.ilike(f'%{query}%')
-            )
-        )
-    
     if category:
         cars_query = cars_query.filter_by(category=category)
     
@@ -194,12 +215,37 @@ def cars():
     if max_price:
         cars_query = cars_query.filter(Car.price_per_day <= max_price)
     
-    # Pagination
-    cars_paginated = cars_query.paginate(page=page, per_page=app.config['CARS_PER_PAGE'], error_out=False)
+    # Only keep cars that are free for the whole requested rental period
+    dated = bool(start_date and end_date and end_date > start_date)
+    if start_date and end_date:
+        if not dated:
+            flash('End date must be after start date.', 'warning')
+        else:
+            cars_query = filter_available(cars_query, start_date, end_date)
+    
+    # Text search last: with many matches it ranks only the cars the filters above keep
+    if query:
+        cars_query = car_search.filter(cars_query, query)
+    
+    # Pagination: text searches keep their relevance order and page by offset,
+    # plain browsing pages newest-first by keyset
+    if query:
+        cars_paginated = cars_query.paginate(page=page, per_page=app.config['CARS_PER_PAGE'], error_out=False)
+    else:
+        cars_paginated = paginate(cars_query, CAR_KEY,
+                                  key=lambda car: (car.created_at, car.id),
+                                  per_page=app.config['CARS_PER_PAGE'])
+    
+    # Exact totals for the requested dates, priced for the whole page at once
+    quotes = pricing.quote_cars(cars_paginated.items, start_date, end_date) if dated else {}
     
-    return render_template('cars.html', cars=cars_paginated, query=query, category=category)
+    return render_template('cars.html', cars=cars_paginated, query=query, category=category,
+                           start_date=start_date, end_date=end_date, today=date.today(),
+                           quotes=quotes, rental_days=(end_date - start_date).days if dated else None)
 
 @app.route('/car/<int:car_id>')
+@read_only
+@page_cache.cached(tags=('car:{car_id}',))
 def car_detail(car_id):
     """View car details"""
     car = Car.query.get_or_404(car_id)
@@ -208,6 +254,7 @@ def car_detail(car_id):
 
 @app.route('/book/<int:car_id>', methods=['POST'])
 @login_required
+@limiter.limit('book', 'user')
 def book_car(car_id):
     """Create a new booking"""
     if current_user.is_admin:
@@ -218,41 +265,27 @@ def book_car(car_id):
     form = BookingForm()
     
     if form.validate_on_submit():
-        # Calculate total days
         start_date = form.start_date.data
         end_date = form.end_date.data
-        total_days = (end_date - start_date).days
         
         # Check car availability for selected dates
-        conflicting_bookings = Booking.query.filter(
-            and_(
-                Booking.car_id == car_id,
-                Booking.status.in_(['pending', 'approved']),
-                or_(
-                    and_(Booking.start_date <= start_date, Booking.end_date >= start_date),
-                    and_(Booking.start_date <= end_date, Booking.end_date >= end_date),
-                    and_(Booking.start_date >= start_date, Booking.end_date <= end_date)
-                )
-            )
-        ).first()
+        conflicting_booking = availability.find_conflict(car_id, start_date, end_date)
         
-        if conflicting_bookings:
+        if conflicting_booking:
             flash('This car is already booked for the selected dates.', 'danger')
             return redirect(url_for('car_detail', car_id=car_id))
         
-        # Create booking
-        booking = Booking(
-            user_id=current_user.id,
-            car_id=car_id,
-            start_date=start_date,
-            end_date=end_date,
-            total_days=total_days,
-            total_price=total_days * car.price_per_day,
-            notes=form.notes.data
-        )
-        
-        db.session.add(booking)
-        db.session.commit()
+        # Create booking; reserve() re-checks against concurrent bookings
+        try:
+            booking = reservations.reserve(current_user.id, car_id, start_date, end_date,
+                                           notes=form.notes.data)
+        except reservations.BookingConflict:
+            flash('This car is already booked for the selected dates.', 'danger')
+            return redirect(url_for('car_detail', car_id=car_id))
+        except reservations.BookingBusy:
+            flash('Someone else is booking this car right now. Please try again.', 'warning')
+            return redirect(url_for('car_detail', car_id=car_id))
+        reports.invalidate_dashboard()
         
         flash(f'Booking request submitted successfully! Total: {booking.total_price:,.0f} ៛', 'success')
         return redirect(url_for('my_bookings'))
@@ -271,10 +304,10 @@ def my_bookings():
     if current_user.is_admin:
         return redirect(url_for('admin_dashboard'))
     
-    page = request.args.get('page', 1, type=int)
-    bookings = Booking.query.filter_by(user_id=current_user.id)\
-        .order_by(Booking.booking_date.desc())\
-        .paginate(page=page, per_page=app.config['BOOKINGS_PER_PAGE'], error_out=False)
+    bookings = paginate(bookings_with_car().filter_by(user_id=current_user.id),
+                        BOOKING_KEY,
+                        key=lambda booking: (booking.booking_date, booking.id),
+                        per_page=app.config['BOOKINGS_PER_PAGE'])
     
     return render_template('my_bookings.html', bookings=bookings, today=date.today())
 
@@ -308,6 +341,8 @@ def cancel_booking(booking_id):
                 # Update booking status and commit together to maintain consistency
                 booking.status = 'cancelled'
                 db.session.commit()
+                page_cache.invalidate('catalog', f'car:{car.id}')
+                reports.invalidate_dashboard()
                 flash('Booking cancelled successfully and car marked as available.', 'success')
             else:
                 flash('Error: Car not found.', 'danger')
@@ -316,6 +351,7 @@ def cancel_booking(booking_id):
             # For non-approved bookings, just update the status
             booking.status = 'cancelled'
             db.session.commit()
+            reports.invalidate_dashboard()
             flash('Booking cancelled successfully.', 'success')
             
     except Exception as e:
@@ -341,23 +377,28 @@ def admin_dashboard():
         flash('Access denied. Admin only.', 'danger')
         return redirect(url_for('index'))
     
-    # Statistics
-    total_cars = Car.query.count()
-    available_cars = Car.query.filter_by(is_available=True).count()
-    total_users = User.query.filter_by(is_admin=False).count()
-    total_bookings = Booking.query.count()
-    pending_bookings = Booking.query.filter_by(status='pending').count()
+    # Statistics (one query, cached briefly)
+    stats = reports.dashboard_stats()
     
     # Recent bookings
-    recent_bookings = Booking.query.order_by(Booking.booking_date.desc()).limit(5).all()
+    recent_bookings = bookings_with_details().order_by(Booking.booking_date.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html',
-                         total_cars=total_cars,
-                         available_cars=available_cars,
-                         total_users=total_users,
-                         total_bookings=total_bookings,
-                         pending_bookings=pending_bookings,
-                         recent_bookings=recent_bookings)
+                         recent_bookings=recent_bookings,
+                         **stats,
+                         cache_stats=page_cache.stats(),
+                         pool_stats=pool_metrics.snapshot(db.engine))
+
+
+@app.route('/admin/pool-stats')
+@login_required
+def admin_pool_stats():
+    """Connection pool metrics of the worker serving this request"""
+    if not current_user.is_admin:
+        flash('Access denied. Admin only.', 'danger')
+        return redirect(url_for('index'))
+    
+    return jsonify(pool_metrics.snapshot(db.engine))
 
 @app.route('/admin/cars')
 @login_required
@@ -367,9 +408,9 @@ def admin_cars():
         flash('Access denied.', 'danger')
         return redirect(url_for('index'))
     
-    page = request.args.get('page', 1, type=int)
-    cars = Car.query.order_by(Car.created_at.desc())\
-        .paginate(page=page, per_page=app.config['CARS_PER_PAGE'], error_out=False)
+    cars = paginate(Car.query, CAR_KEY,
+                    key=lambda car: (car.created_at, car.id),
+                    per_page=app.config['CARS_PER_PAGE'])
     
     return render_template('admin/cars.html', cars=cars)
 
@@ -420,6 +461,8 @@ def admin_add_car():
             flash('Unable to add car. Please check the details and try again.', 'danger')
             return render_template('admin/car_form.html', form=form, title='Add Car')
 
+        page_cache.invalidate('catalog')
+        reports.invalidate_dashboard()
         flash('Car added successfully!', 'success')
         return redirect(url_for('admin_cars'))
     
@@ -470,6 +513,8 @@ def admin_edit_car(car_id):
             flash('Unable to update car. Please check the details and try again.', 'danger')
             return render_template('admin/car_form.html', form=form, title='Edit Car', car=car)
 
+        page_cache.invalidate('catalog', f'car:{car.id}')
+        reports.invalidate_dashboard()
         flash('Car updated successfully!', 'success')
         return redirect(url_for('admin_cars'))
     
@@ -495,6 +540,8 @@ def admin_delete_car(car_id):
     
     db.session.delete(car)
     db.session.commit()
+    page_cache.invalidate('catalog', f'car:{car_id}')
+    reports.invalidate_dashboard()
     flash('Car deleted successfully!', 'success')
     return redirect(url_for('admin_cars'))
 
@@ -506,15 +553,15 @@ def admin_bookings():
         flash('Access denied.', 'danger')
         return redirect(url_for('index'))
     
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '')
     
-    query = Booking.query
+    query = bookings_with_details()
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    bookings = query.order_by(Booking.booking_date.desc())\
-        .paginate(page=page, per_page=app.config['BOOKINGS_PER_PAGE'], error_out=False)
+    bookings = paginate(query, BOOKING_KEY,
+                        key=lambda booking: (booking.booking_date, booking.id),
+                        per_page=app.config['BOOKINGS_PER_PAGE'])
     
     return render_template('admin/bookings.html', bookings=bookings, status_filter=status_filter)
 
@@ -530,25 +577,18 @@ def admin_approve_booking(booking_id):
     car = Car.query.get_or_404(booking.car_id)
     
     # Check if car is already unavailable
-    if not car.is_available and booking.status != 'approved':
+    if booking.status != 'approved' and not approvals.accepts_approvals(car):
         flash('Car is no longer available. Cannot approve booking.', 'danger')
         return redirect(url_for('admin_bookings'))
     
     # Check for date conflicts with other approved bookings
-    conflicting_bookings = Booking.query.filter(
-        and_(
-            Booking.car_id == car.id,
-            Booking.id != booking.id,  # Exclude current booking
-            Booking.status == 'approved',
-            or_(
-                and_(Booking.start_date <= booking.start_date, Booking.end_date >= booking.start_date),
-                and_(Booking.start_date <= booking.end_date, Booking.end_date >= booking.end_date),
-                and_(Booking.start_date >= booking.start_date, Booking.end_date <= booking.end_date)
-            )
-        )
-    ).first()
+    conflicting_booking = availability.find_conflict(
+        car.id, booking.start_date, booking.end_date,
+        statuses=('approved',),
+        exclude_id=booking.id  # Exclude current booking
+    )
     
-    if conflicting_bookings:
+    if conflicting_booking:
         flash('Cannot approve booking: Date conflict with another approved booking.', 'danger')
         return redirect(url_for('admin_bookings'))
     
@@ -557,6 +597,8 @@ def admin_approve_booking(booking_id):
         booking.status = 'approved'
         car.is_available = False
         db.session.commit()
+        page_cache.invalidate('catalog', f'car:{car.id}')
+        reports.invalidate_dashboard()
         flash('Booking approved and car marked as unavailable!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -565,7 +607,35 @@ def admin_approve_booking(booking_id):
     
     return redirect(url_for('admin_bookings'))
 
+@app.route('/admin/bookings/approve-batch', methods=['POST'])
+@login_required
+def admin_approve_bookings():
+    """Admin: Approve the selected pending bookings, rejecting clashing ones"""
+    if not current_user.is_admin:
+        flash('Access denied.', 'danger')
+        return redirect(url_for('index'))
+    
+    booking_ids = request.form.getlist('booking_ids', type=int)
+    policy = request.form.get('policy', 'first-come')
+    if not booking_ids:
+        flash('Select the bookings to approve first.', 'warning')
+        return redirect(url_for('admin_bookings', status='pending'))
+    if policy not in approvals.POLICIES:
+        flash('Unknown approval policy.', 'danger')
+        return redirect(url_for('admin_bookings', status='pending'))
+    
+    try:
+        report = approvals.approve_batch(booking_ids, policy=policy)
+        flash(f'Approved {len(report.approved)}, rejected {len(report.rejected)} clashing and left '
+              f'{len(report.skipped)} pending (car unavailable) in {report.elapsed * 1000:.0f} ms.', 'success')
+    except Exception as e:
+        app.logger.exception('Error approving bookings')
+        flash(f'Error approving bookings: {str(e)}. Please try again.', 'danger')
+    
+    return redirect(url_for('admin_bookings', status='pending'))
+
 @app.route('/admin/customers')
+@read_only
 @login_required
 def admin_customers():
     """Admin: View all customers"""
@@ -573,14 +643,14 @@ def admin_customers():
         flash('Access denied.', 'danger')
         return redirect(url_for('index'))
     
-    page = request.args.get('page', 1, type=int)
-    customers = User.query.filter_by(is_admin=False)\
-        .order_by(User.created_at.desc())\
-        .paginate(page=page, per_page=20, error_out=False)
+    customers = paginate(customers_with_booking_counts(), CUSTOMER_KEY,
+                         key=lambda row: (row[0].created_at, row[0].id),
+                         per_page=20)
     
     return render_template('admin/customers.html', customers=customers)
 
 @app.route('/admin/reports')
+@read_only
 @login_required
 def admin_reports():
     """Admin: View reports"""
@@ -588,47 +658,62 @@ def admin_reports():
         flash('Access denied.', 'danger')
         return redirect(url_for('index'))
     
-    # Get report data
-    from sqlalchemy import func
-    from datetime import timedelta
-    
+    # Report period: the last N days (default 7), read from the rollup tables
+    days = min(max(request.args.get('days', 7, type=int), 1), 3660)
     today = date.today()
-    week_ago = today - timedelta(days=7)
-    
-    # Daily bookings (last 7 days)
-    daily_bookings = db.session.query(
-        func.date(Booking.booking_date).label('date'),
-        func.count(Booking.id).label('count'),
-        func.sum(Booking.total_price).label('revenue')
-    ).filter(Booking.booking_date >= week_ago)\
-     .group_by(func.date(Booking.booking_date))\
-     .all()
-    
-    # Bookings by status
-    status_summary = db.session.query(
-        Booking.status,
-        func.count(Booking.id).label('count')
-    ).group_by(Booking.status).all()
-    
-    # Most popular cars
-    popular_cars = db.session.query(
-        Car.brand,
-        Car.model,
-        func.count(Booking.id).label('bookings')
-    ).join(Booking, Car.id == Booking.car_id)\
-     .group_by(Car.id)\
-     .order_by(func.count(Booking.id).desc())\
-     .limit(5).all()
-    
-    # Total revenue
-    total_revenue = db.session.query(func.sum(Booking.total_price))\
-        .filter(Booking.status.in_(['approved', 'completed'])).scalar() or 0
+    period_start = today - timedelta(days=days)
+    
+    daily_bookings = reports.daily_bookings(period_start, today)
+    status_summary = reports.status_summary()
+    popular_cars = reports.popular_cars(limit=5)
+    total_revenue = reports.total_revenue()
     
     return render_template('admin/reports.html',
                          daily_bookings=daily_bookings,
                          status_summary=status_summary,
                          popular_cars=popular_cars,
-                         total_revenue=total_revenue)
+                         total_revenue=total_revenue,
+                         days=days)
+
+@app.route('/admin/export/bookings.csv')
+@read_only
+@login_required
+def admin_export_bookings():
+    """Admin: Download bookings as CSV (same status filter as admin_bookings)"""
+    if not current_user.is_admin:
+        flash('Access denied.', 'danger')
+        return redirect(url_for('index'))
+    
+    status_filter = request.args.get('status', '')
+    header, query = exports.bookings_export(status_filter)
+    return exports.csv_response(secure_filename(f'bookings-{status_filter}') if status_filter else 'bookings',
+                                header, query)
+
+@app.route('/admin/export/customers.csv')
+@read_only
+@login_required
+def admin_export_customers():
+    """Admin: Download customers as CSV"""
+    if not current_user.is_admin:
+        flash('Access denied.', 'danger')
+        return redirect(url_for('index'))
+    
+    header, query = exports.customers_export()
+    return exports.csv_response('customers', header, query)
+
+@app.route('/admin/export/reports.csv')
+@read_only
+@login_required
+def admin_export_reports():
+    """Admin: Download the daily report rollups for the last N days as CSV"""
+    if not current_user.is_admin:
+        flash('Access denied.', 'danger')
+        return redirect(url_for('index'))
+    
+    days = min(max(request.args.get('days', 7, type=int), 1), 3660)
+    today = date.today()
+    header, query = exports.rollups_export(today - timedelta(days=days), today)
+    return exports.csv_response(f'report-{days}d', header, query)
 
 # Error handlers
 @app.errorhandler(404)
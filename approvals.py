@@ -0,0 +1,188 @@
+"""
+Bulk Booking Approval
+Approves many pending bookings at once, resolving date conflicts in memory.
+
+    flask bookings auto-approve
+    flask bookings auto-approve --policy highest-value --dry-run
+    flask bookings auto-approve --every 60        # keep running as a worker
+
+A batch (the bookings an admin ticked, or every pending booking) is
+resolved with three queries: the pending bookings, the approved bookings
+they could clash with, and their cars. Each car's candidates are then
+swept in policy order: a booking whose dates overlap an approved one, or
+one approved earlier in the sweep, is rejected (cancelled), the rest are
+approved. All status changes are committed in one transaction, which also
+keeps the report rollups and the availability index current.
+
+Both this and the single approve button use accepts_approvals: bookings
+of a car that is marked unavailable are left pending. A car with a new
+approval is marked unavailable, so later batches and single approvals
+leave its other bookings pending.
+"""
+import time
+from bisect import bisect_right
+
+import click
+from flask.cli import AppGroup
+
+from models import db, Car, Booking
+from cache import page_cache
+import reports
+
+# Order in which a car's competing requests are considered
+POLICIES = {
+    'first-come': lambda booking: (booking.booking_date, booking.id),
+    'highest-value': lambda booking: (-(booking.total_price or 0), booking.booking_date, booking.id),
+}
+
+
+class ApprovalReport:
+    """What a batch did, and how fast."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.approved = []
+        self.rejected = []
+        self.skipped = []
+
+    @property
+    def processed(self):
+        return len(self.approved) + len(self.rejected) + len(self.skipped)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        rate = self.processed / elapsed if elapsed else 0
+        return (f'{self.processed:,} bookings in {elapsed:.2f}s ({rate:,.0f}/s): '
+                f'{len(self.approved):,} approved, {len(self.rejected):,} rejected, '
+                f'{len(self.skipped):,} left pending')
+
+
+class Timeline:
+    """Disjoint closed date ranges of one car, sorted by start."""
+
+    def __init__(self, ranges=()):
+        self.starts = []
+        self.ends = []
+        # Merge overlapping ranges so each lookup only needs its neighbours
+        for start, end in sorted(ranges):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlaps(self, start, end):
+        i = bisect_right(self.starts, end) - 1
+        return i >= 0 and self.ends[i] >= start
+
+    def add(self, start, end):
+        i = bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def accepts_approvals(car):
+    """Whether pending bookings of car may be approved; False once it is unavailable."""
+    return car is not None and car.is_available
+
+
+def resolve(pending, approved_ranges, policy='first-come'):
+    """Split one car's pending bookings into (approved, rejected) lists."""
+    timeline = Timeline(approved_ranges)
+    approved, rejected = [], []
+    for booking in sorted(pending, key=POLICIES[policy]):
+        if timeline.overlaps(booking.start_date, booking.end_date):
+            rejected.append(booking)
+        else:
+            timeline.add(booking.start_date, booking.end_date)
+            approved.append(booking)
+    return approved, rejected
+
+
+def approve_batch(booking_ids=None, policy='first-come', limit=None, dry_run=False):
+    """Resolve and commit a batch of pending bookings. Returns an ApprovalReport.
+
+    booking_ids selects the batch; by default it is every pending booking,
+    oldest first, up to limit.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f'Unknown approval policy: {policy!r}')
+    report = ApprovalReport()
+
+    query = Booking.query.filter(Booking.status == 'pending')
+    if booking_ids is not None:
+        query = query.filter(Booking.id.in_(list(booking_ids)))
+    query = query.order_by(Booking.booking_date, Booking.id)
+    if limit:
+        query = query.limit(limit)
+    by_car = {}
+    for booking in query:
+        by_car.setdefault(booking.car_id, []).append(booking)
+    if not by_car:
+        report.finish()
+        return report
+
+    earliest = min(booking.start_date for bookings in by_car.values() for booking in bookings)
+    approved_ranges = {}
+    for car_id, start, end in db.session.query(Booking.car_id, Booking.start_date, Booking.end_date).filter(
+            Booking.car_id.in_(list(by_car)), Booking.status == 'approved', Booking.end_date >= earliest):
+        approved_ranges.setdefault(car_id, []).append((start, end))
+    cars = {car.id: car for car in Car.query.filter(Car.id.in_(list(by_car)))}
+
+    changed_cars = []
+    for car_id, pending in by_car.items():
+        car = cars.get(car_id)
+        if not accepts_approvals(car):
+            report.skipped.extend(pending)
+            continue
+        approved, rejected = resolve(pending, approved_ranges.get(car_id, ()), policy)
+        for booking in approved:
+            booking.status = 'approved'
+        for booking in rejected:
+            booking.status = 'cancelled'
+        if approved:
+            car.is_available = False
+            changed_cars.append(car_id)
+        report.approved.extend(approved)
+        report.rejected.extend(rejected)
+
+    if dry_run:
+        db.session.rollback()
+    elif report.approved or report.rejected:
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        page_cache.invalidate('catalog', *(f'car:{car_id}' for car_id in changed_cars))
+        reports.invalidate_dashboard()
+    report.finish()
+    return report
+
+
+def init_app(app):
+    app.cli.add_command(bookings_cli)
+
+
+bookings_cli = AppGroup('bookings', help='Booking maintenance.')
+
+
+@bookings_cli.command('auto-approve')
+@click.option('--policy', type=click.Choice(sorted(POLICIES)), default='first-come', show_default=True,
+              help='Which of several clashing requests for a car wins.')
+@click.option('--limit', type=int, help='Most pending bookings to handle per batch.')
+@click.option('--dry-run', is_flag=True, help='Report the outcome without saving it.')
+@click.option('--every', type=float, metavar='SECONDS', help='Keep running, one batch every SECONDS.')
+def auto_approve_command(policy, limit, dry_run, every):
+    """Approve pending bookings, rejecting the ones that clash."""
+    while True:
+        report = approve_batch(policy=policy, limit=limit, dry_run=dry_run)
+        click.echo(('[dry run] ' if dry_run else '') + report.summary())
+        if not every:
+            return
+        db.session.remove()
+        time.sleep(every)
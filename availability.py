@@ -0,0 +1,271 @@
+"""
+Availability Engine
+In-memory per-car interval index used to detect booking date conflicts
+without running an overlap query against the bookings table.
+"""
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from sqlalchemy import event, inspect, and_, exists
+from sqlalchemy.orm import Session
+
+from models import db, Car, Booking
+from replicas import use_primary
+
+# Booking statuses that block a car for their date range
+ACTIVE_STATUSES = ('pending', 'approved')
+
+# Days covered by a car's occupancy calendar, starting today
+CALENDAR_DAYS = 365
+
+
+def query_conflict(car_id, start_date, end_date, statuses=ACTIVE_STATUSES, exclude_id=None):
+    """SQL fallback: return the id of a booking overlapping the range, or None.
+
+    Two closed date ranges overlap when each one starts on or before the
+    other one ends.
+    """
+    query = db.session.query(Booking.id).filter(
+        and_(
+            Booking.car_id == car_id,
+            Booking.status.in_(statuses),
+            Booking.start_date <= end_date,
+            Booking.end_date >= start_date
+        )
+    )
+    if exclude_id is not None:
+        query = query.filter(Booking.id != exclude_id)
+    row = query.first()
+    return row[0] if row else None
+
+
+def filter_available(query, start_date, end_date):
+    """Restrict a Car query to cars with no active booking overlapping the range.
+
+    Adds a single NOT EXISTS anti-join, so the whole search (filters,
+    pagination and availability) stays one round trip however many cars
+    it covers.
+    """
+    overlapping = exists().where(
+        and_(
+            Booking.car_id == Car.id,
+            Booking.status.in_(ACTIVE_STATUSES),
+            Booking.start_date <= end_date,
+            Booking.end_date >= start_date
+        )
+    )
+    return query.filter(~overlapping)
+
+
+class CarIntervals:
+    """Sorted booking ranges of a single car.
+
+    Ranges are kept ordered by start date together with a running maximum of
+    their end dates, so a lookup is one bisect plus a short backwards walk
+    that stops as soon as no earlier range can reach the requested start.
+    Instances are never mutated in place; updates build a new instance.
+    """
+
+    __slots__ = ('starts', 'ends', 'max_ends', 'ids', 'statuses', 'loaded_at')
+
+    def __init__(self, rows, loaded_at=None):
+        rows = sorted(rows, key=lambda r: (r[1], r[2], r[0]))
+        self.ids = [r[0] for r in rows]
+        self.starts = [r[1] for r in rows]
+        self.ends = [r[2] for r in rows]
+        self.statuses = [r[3] for r in rows]
+        self.max_ends = []
+        running = None
+        for end in self.ends:
+            running = end if running is None or end > running else running
+            self.max_ends.append(running)
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self):
+        return zip(self.ids, self.starts, self.ends, self.statuses)
+
+    def find(self, start_date, end_date, statuses=ACTIVE_STATUSES, exclude_id=None):
+        """Return the id of the first range overlapping [start_date, end_date]."""
+        i = bisect_right(self.starts, end_date) - 1
+        while i >= 0 and self.max_ends[i] >= start_date:
+            if (self.ends[i] >= start_date and self.statuses[i] in statuses
+                    and self.ids[i] != exclude_id):
+                return self.ids[i]
+            i -= 1
+        return None
+
+    def occupancy(self, first_day, days):
+        """Bitset of the days from first_day on that an active booking covers.
+
+        Bit i (byte i // 8, least significant bit first) is set when
+        first_day + i days falls inside a booking, both ends included.
+        """
+        bits = bytearray((days + 7) // 8)
+        last_day = first_day + timedelta(days=days - 1)
+        for start, end, status in zip(self.starts, self.ends, self.statuses):
+            if status not in ACTIVE_STATUSES or end < first_day or start > last_day:
+                continue
+            for i in range(max((start - first_day).days, 0), min((end - first_day).days, days - 1) + 1):
+                bits[i >> 3] |= 1 << (i & 7)
+        return bytes(bits)
+
+    def replace(self, booking_id, row=None):
+        """Return a copy with booking_id removed and, if given, row added."""
+        rows = [r for r in self.rows() if r[0] != booking_id]
+        if row is not None:
+            rows.append(row)
+        return CarIntervals(rows, loaded_at=self.loaded_at)
+
+
+class AvailabilityIndex:
+    """Per-car interval index of pending/approved bookings.
+
+    Car slices are loaded lazily with one query the first time a car is
+    checked and then kept in sync from committed ORM changes through
+    SQLAlchemy session events. Each worker process holds its own index, so
+    slices are reloaded after ``AVAILABILITY_INDEX_TTL`` seconds to pick up
+    bookings written by other processes.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.ttl = None
+        self._cars = {}
+        self._calendars = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('AVAILABILITY_INDEX_ENABLED', True)
+        self.ttl = app.config.get('AVAILABILITY_INDEX_TTL')
+        app.extensions['availability_index'] = self
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+
+    # Lookups
+
+    def find_conflict(self, car_id, start_date, end_date, statuses=ACTIVE_STATUSES, exclude_id=None):
+        """Return the id of a booking of car_id overlapping the range, or None."""
+        if not self.enabled:
+            return query_conflict(car_id, start_date, end_date, statuses, exclude_id)
+        intervals = self._get(car_id)
+        return intervals.find(start_date, end_date, statuses, exclude_id)
+
+    def calendar(self, car_id, days=CALENDAR_DAYS):
+        """Return (first_day, bitset) of the days car_id is booked from today on.
+
+        The bitset is built from the car's slice and reused until the slice
+        changes (a booking is made, approved or cancelled) or the day rolls over.
+        """
+        today = date.today()
+        if not self.enabled:
+            rows = db.session.query(Booking.id, Booking.start_date, Booking.end_date, Booking.status)\
+                .filter(Booking.car_id == car_id, Booking.status.in_(ACTIVE_STATUSES),
+                        Booking.end_date >= today).all()
+            return today, CarIntervals([tuple(r) for r in rows]).occupancy(today, days)
+        intervals = self._get(car_id)
+        cached = self._calendars.get(car_id)
+        if cached is not None and cached[0] is intervals and cached[1] == (today, days):
+            return today, cached[2]
+        bits = intervals.occupancy(today, days)
+        with self._lock:
+            self._calendars[car_id] = (intervals, (today, days), bits)
+        return today, bits
+
+    def _get(self, car_id):
+        intervals = self._cars.get(car_id)
+        if intervals is None or self._expired(intervals):
+            intervals = self._load(car_id)
+        return intervals
+
+    def _expired(self, intervals):
+        return self.ttl is not None and time.monotonic() - intervals.loaded_at > self.ttl
+
+    def _load(self, car_id):
+        # Never from a replica: a lagging copy would hide recent bookings
+        with use_primary():
+            rows = db.session.query(
+                Booking.id, Booking.start_date, Booking.end_date, Booking.status
+            ).filter(
+                Booking.car_id == car_id,
+                Booking.status.in_(ACTIVE_STATUSES)
+            ).all()
+        intervals = CarIntervals([tuple(r) for r in rows])
+        with self._lock:
+            self._cars[car_id] = intervals
+        return intervals
+
+    def warm(self, batch_size=50000):
+        """Load every active booking into the index. Returns the number loaded."""
+        by_car = {}
+        query = db.session.query(
+            Booking.car_id, Booking.id, Booking.start_date, Booking.end_date, Booking.status
+        ).filter(Booking.status.in_(ACTIVE_STATUSES)).execution_options(yield_per=batch_size)
+        count = 0
+        with use_primary():
+            for car_id, booking_id, start, end, status in query:
+                by_car.setdefault(car_id, []).append((booking_id, start, end, status))
+                count += 1
+            loaded_at = time.monotonic()
+            car_ids = [row[0] for row in db.session.query(Car.id)]
+        with self._lock:
+            self._cars = {car_id: CarIntervals(by_car.get(car_id, ()), loaded_at) for car_id in car_ids}
+        return count
+
+    def invalidate(self, car_id=None):
+        """Drop one car's slice, or the whole index when car_id is None."""
+        with self._lock:
+            if car_id is None:
+                self._cars.clear()
+                self._calendars.clear()
+            else:
+                self._cars.pop(car_id, None)
+                self._calendars.pop(car_id, None)
+
+    # Session event handlers
+
+    def _after_flush(self, session, flush_context):
+        changes = session.info.setdefault('availability_changes', {})
+        for obj in session.new.union(session.dirty):
+            if isinstance(obj, Booking):
+                changes[obj.id] = (obj.car_id, (obj.id, obj.start_date, obj.end_date, obj.status))
+                # A booking moved to another car must leave its old slice
+                old_car_ids = inspect(obj).attrs.car_id.history.deleted
+                for old_car_id in old_car_ids or ():
+                    changes[('moved', obj.id, old_car_id)] = (old_car_id, (obj.id, None, None, None))
+            elif isinstance(obj, Car) and obj in session.new:
+                changes[('car', obj.id)] = (obj.id, None)
+        for obj in session.deleted:
+            if isinstance(obj, Booking):
+                changes[obj.id] = (obj.car_id, (obj.id, None, None, None))
+            elif isinstance(obj, Car):
+                changes[('car', obj.id)] = (obj.id, None)
+
+    def _after_commit(self, session):
+        changes = session.info.pop('availability_changes', None)
+        if not changes:
+            return
+        with self._lock:
+            for car_id, row in changes.values():
+                if row is None:
+                    self._cars.pop(car_id, None)
+                    continue
+                intervals = self._cars.get(car_id)
+                if intervals is None:
+                    continue
+                keep = row if row[3] in ACTIVE_STATUSES else None
+                self._cars[car_id] = intervals.replace(row[0], keep)
+
+    def _after_rollback(self, session):
+        session.info.pop('availability_changes', None)
+
+
+availability = AvailabilityIndex()
@@ -0,0 +1,41 @@
+"""
+Benchmark scripts. Run from the project root, e.g.
+    python -m benchmarks.availability
+
+The scripts drop and refill their database, so they never use DATABASE_URL.
+They run against BENCH_DATABASE_URL when set, otherwise a throwaway SQLite
+file, and only drop a database that is not a temporary SQLite file after
+you confirm, or with BENCH_RESET=1 in the environment.
+"""
+import os
+import sys
+import tempfile
+
+BENCH_DB_PATH = os.path.join(tempfile.gettempdir(), 'car_rental_bench.db')
+
+
+def use_bench_database(default=None):
+    """Point the app at the benchmark database. Call before importing app."""
+    os.environ['DATABASE_URL'] = (os.environ.get('BENCH_DATABASE_URL') or default
+                                  or f'sqlite:///{BENCH_DB_PATH}')
+
+
+def _disposable(url):
+    """True for in-memory SQLite and SQLite files under the temp directory."""
+    if url.get_backend_name() != 'sqlite':
+        return False
+    if not url.database or url.database == ':memory:':
+        return True
+    path = os.path.realpath(url.database)
+    return path.startswith(os.path.realpath(tempfile.gettempdir()) + os.sep)
+
+
+def reset_database(db):
+    """Drop and recreate every table, after confirming unless the database is disposable."""
+    url = db.engine.url
+    if not _disposable(url) and os.environ.get('BENCH_RESET') != '1':
+        shown = url.render_as_string(hide_password=True)
+        if not sys.stdin.isatty() or input(f'Drop every table in {shown}? [y/N] ').strip().lower() != 'y':
+            raise SystemExit(f'Not dropping {shown}; set BENCH_RESET=1 to allow it')
+    db.drop_all()
+    db.create_all()
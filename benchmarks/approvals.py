@@ -0,0 +1,113 @@
+"""
+Approval Benchmark
+Approval throughput of the one-by-one admin button against approvals.approve_batch.
+
+    python -m benchmarks.approvals --requests 5000 --hot-cars 20
+
+Generates the benchmarks.datagen dataset, then adds --requests pending
+bookings crowded onto --hot-cars cars so that many of them clash. The
+first --single of them are approved through POST /admin/booking/approve
+like an admin clicking through the list; the rest, on another --hot-cars
+cars since both paths leave an unavailable car's bookings pending, go
+through one approve_batch call. Both report bookings per second and SQL
+statements.
+
+Uses BENCH_DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks import use_bench_database
+
+use_bench_database()
+
+from sqlalchemy import event
+
+from app import app
+from models import db, User, Car, Booking
+from approvals import approve_batch, POLICIES
+from availability import availability
+from benchmarks.datagen import generate
+
+
+def add_requests(count, hot_cars, seed, skip_cars=0):
+    """Insert count pending bookings on hot_cars cars, past the generated timeline."""
+    rng = random.Random(seed)
+    cars = db.session.query(Car.id, Car.price_per_day).filter(Car.is_available == True)\
+        .order_by(Car.id).offset(skip_cars).limit(hot_cars).all()
+    user_ids = [row[0] for row in db.session.query(User.id).filter(User.is_admin == False).limit(1000)]
+    first_day = date.today() + timedelta(days=400)
+    made = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        car_id, price = rng.choice(cars)
+        start = first_day + timedelta(days=rng.randrange(365))
+        days = rng.randint(1, 7)
+        rows.append({'car_id': car_id, 'user_id': rng.choice(user_ids), 'start_date': start,
+                     'end_date': start + timedelta(days=days), 'total_days': days,
+                     'total_price': days * price, 'status': 'pending',
+                     'booking_date': made + timedelta(seconds=i)})
+    db.session.execute(db.insert(Booking), rows)
+    db.session.commit()
+    availability.invalidate()
+    return [row[0] for row in db.session.query(Booking.id).filter(
+        Booking.status == 'pending', Booking.booking_date >= made, Booking.start_date >= first_day,
+        Booking.car_id.in_([car_id for car_id, _ in cars])
+    ).order_by(Booking.booking_date)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--hot-cars', type=int, default=20)
+    parser.add_argument('--single', type=int, default=200, help='approved one by one first')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='first-come')
+    parser.add_argument('--cars', type=int, default=200)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--bookings', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        generate(args.cars, args.users, args.bookings, echo=lambda message: None)
+        single_ids = add_requests(min(args.single, args.requests), args.hot_cars, args.seed)
+        batch_ids = add_requests(args.requests - len(single_ids), args.hot_cars, args.seed + 1,
+                                 skip_cars=args.hot_cars)
+        engine = db.engine
+
+    statements = [0]
+
+    def count(*_):
+        statements[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        client = app.test_client()
+        client.post('/login', data={'email': 'admin@example.com', 'password': 'admin'})
+        statements[0] = 0
+        started = time.perf_counter()
+        for booking_id in single_ids:
+            client.post(f'/admin/booking/approve/{booking_id}')
+        single_elapsed = time.perf_counter() - started
+        single_statements = statements[0]
+
+        statements[0] = 0
+        with app.app_context():
+            report = approve_batch(batch_ids, policy=args.policy)
+        batch_statements = statements[0]
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    print(f'{len(single_ids) + len(batch_ids):,} pending requests on {args.hot_cars} cars per path')
+    if single_ids:
+        print(f'one by one: {len(single_ids):,} bookings in {single_elapsed:.2f}s '
+              f'({len(single_ids) / single_elapsed:,.0f}/s), {single_statements:,} statements')
+    print(f'batch:      {report.summary()}, {batch_statements:,} statements')
+
+
+if __name__ == '__main__':
+    main()
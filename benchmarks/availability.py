@@ -0,0 +1,107 @@
+"""
+Availability Benchmark
+Compares the in-memory interval index with the SQL overlap query.
+
+    python -m benchmarks.availability --cars 10000 --bookings 1000000
+
+Uses BENCH_DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks import use_bench_database, reset_database
+
+use_bench_database()
+
+from app import app
+from models import db, User, Car, Booking
+from availability import availability, query_conflict
+
+STATUSES = ['pending', 'approved', 'cancelled', 'completed']
+CATEGORIES = ['Sedan', 'SUV', 'Van', 'Pickup']
+
+
+def seed(num_cars, num_bookings, batch_size=50000):
+    """Recreate the schema and bulk insert cars and bookings."""
+    reset_database(db)
+    db.session.execute(db.insert(User), [{
+        'email': 'bench@example.com', 'password_hash': '-', 'full_name': 'Bench User'
+    }])
+    rng = random.Random(42)
+    db.session.execute(db.insert(Car), [{
+        'brand': 'Brand', 'model': f'Model {i}', 'category': CATEGORIES[i % len(CATEGORIES)],
+        'seat_capacity': 5, 'price_per_day': rng.randrange(50, 400) * 1000,
+        'is_available': rng.random() < 0.8, 'license_plate': f'BN-{i:06d}'
+    } for i in range(num_cars)])
+    db.session.commit()
+
+    origin = date.today() - timedelta(days=365)
+    now = datetime.utcnow()
+    rows = []
+    for _ in range(num_bookings):
+        start = origin + timedelta(days=rng.randrange(730))
+        days = rng.randint(1, 14)
+        rows.append({
+            'user_id': 1, 'car_id': rng.randint(1, num_cars),
+            'start_date': start, 'end_date': start + timedelta(days=days),
+            'total_days': days, 'total_price': days * 100000.0,
+            'status': rng.choice(STATUSES), 'booking_date': now
+        })
+        if len(rows) >= batch_size:
+            db.session.execute(db.insert(Booking), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(Booking), rows)
+    db.session.commit()
+
+
+def make_probes(num_cars, count):
+    rng = random.Random(7)
+    origin = date.today() - timedelta(days=365)
+    probes = []
+    for _ in range(count):
+        start = origin + timedelta(days=rng.randrange(730))
+        probes.append((rng.randint(1, num_cars), start, start + timedelta(days=rng.randint(1, 14))))
+    return probes
+
+
+def timed(label, fn, probes):
+    started = time.perf_counter()
+    hits = sum(1 for probe in probes if fn(*probe))
+    elapsed = time.perf_counter() - started
+    print(f'{label:<22} {len(probes) / elapsed:>12,.0f} checks/s  '
+          f'{elapsed / len(probes) * 1e6:>9.1f} us/check  ({hits} conflicts)')
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cars', type=int, default=10000)
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--probes', type=int, default=5000)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the existing database')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            seed(args.cars, args.bookings)
+            print(f'Seeded {args.cars:,} cars / {args.bookings:,} bookings '
+                  f'in {time.perf_counter() - started:.1f}s')
+
+        probes = make_probes(args.cars, args.probes)
+
+        started = time.perf_counter()
+        loaded = availability.warm()
+        print(f'Index warm-up: {loaded:,} active bookings in {time.perf_counter() - started:.2f}s')
+
+        sql_hits = timed('SQL overlap query', query_conflict, probes)
+        index_hits = timed('Interval index', availability.find_conflict, probes)
+        if sql_hits != index_hits:
+            raise SystemExit(f'Mismatch: SQL found {sql_hits} conflicts, index found {index_hits}')
+
+
+if __name__ == '__main__':
+    main()
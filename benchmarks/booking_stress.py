@@ -0,0 +1,153 @@
+"""
+Booking Stress Test
+Many workers booking random dates on a few cars at once, checked for double
+bookings afterwards.
+
+    python -m benchmarks.booking_stress --workers 16 --cars 1,4,16,64
+    python -m benchmarks.booking_stress --processes --workers 8
+    python -m benchmarks.booking_stress --naive      # the old check-then-insert
+
+For each entry of --cars the workers spread --requests bookings each over
+that many cars, so the first rows are the most contended. Every booking
+asks for 1 to 5 days inside a --days window. After each round the bookings
+table is searched for two active bookings of one car with overlapping
+dates; reservations.reserve must always report 0 of them, --naive usually
+does not.
+
+Uses BENCH_DATABASE_URL when set, otherwise a throwaway SQLite file. SQLite
+serialises all writers, so run it against MySQL or PostgreSQL to see how
+throughput holds up when different cars do not wait for each other.
+"""
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks import use_bench_database
+
+use_bench_database()
+
+from sqlalchemy.orm import aliased
+
+from app import app
+from models import db, User, Car, Booking
+from availability import ACTIVE_STATUSES, query_conflict
+from reservations import reserve, BookingConflict, BookingBusy
+from benchmarks.datagen import generate
+
+
+def naive_reserve(user_id, car_id, start_date, end_date):
+    """The old book_car: check, then insert, with nothing in between."""
+    conflict = query_conflict(car_id, start_date, end_date)
+    if conflict is not None:
+        raise BookingConflict(conflict)
+    car = db.session.get(Car, car_id)
+    days = (end_date - start_date).days
+    db.session.add(Booking(user_id=user_id, car_id=car_id, start_date=start_date, end_date=end_date,
+                           total_days=days, total_price=days * car.price_per_day))
+    db.session.commit()
+
+
+def worker(seed, car_ids, user_ids, requests, window_days, naive):
+    """Make requests bookings. Returns (booked, conflicts, busy)."""
+    rng = random.Random(seed)
+    book = naive_reserve if naive else reserve
+    first_day = date.today() + timedelta(days=30)
+    booked = conflicts = busy = 0
+    for _ in range(requests):
+        start = first_day + timedelta(days=rng.randrange(window_days))
+        end = start + timedelta(days=rng.randint(1, 5))
+        with app.app_context():
+            try:
+                book(rng.choice(user_ids), rng.choice(car_ids), start, end)
+                booked += 1
+            except BookingConflict:
+                conflicts += 1
+            except BookingBusy:
+                busy += 1
+    return booked, conflicts, busy
+
+
+def _process_worker(job):
+    # Connections inherited from the parent must not be shared
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    return worker(*job)
+
+
+def run_round(num_cars, args, user_ids):
+    with app.app_context():
+        db.session.query(Booking).delete()
+        db.session.commit()
+        car_ids = [row[0] for row in db.session.query(Car.id).order_by(Car.id).limit(num_cars)]
+    jobs = [(args.seed * 1000 + i, car_ids, user_ids, args.requests, args.days, args.naive)
+            for i in range(args.workers)]
+
+    started = time.perf_counter()
+    if args.processes:
+        with multiprocessing.get_context('fork').Pool(args.workers) as pool:
+            results = pool.map(_process_worker, jobs)
+    else:
+        results = [None] * len(jobs)
+
+        def run(i):
+            results[i] = worker(*jobs[i])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(jobs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    booked, conflicts, busy = (sum(column) for column in zip(*results))
+    return booked, conflicts, busy, elapsed, double_bookings()
+
+
+def double_bookings():
+    """Number of pairs of active bookings of one car with overlapping dates."""
+    other = aliased(Booking)
+    with app.app_context():
+        return db.session.query(Booking.id).join(other, (other.car_id == Booking.car_id)
+                                                 & (other.id > Booking.id)
+                                                 & (other.start_date <= Booking.end_date)
+                                                 & (other.end_date >= Booking.start_date))\
+            .filter(Booking.status.in_(ACTIVE_STATUSES), other.status.in_(ACTIVE_STATUSES)).count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='bookings attempted per worker')
+    parser.add_argument('--cars', default='1,4,16,64', help='comma separated; fewer cars, more contention')
+    parser.add_argument('--days', type=int, default=120, help='window the booked dates fall in')
+    parser.add_argument('--processes', action='store_true', help='use processes instead of threads')
+    parser.add_argument('--naive', action='store_true', help='check then insert, without reservations')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    levels = [int(value) for value in args.cars.split(',')]
+
+    with app.app_context():
+        generate(max(levels), max(args.workers * 10, 100), 0, echo=lambda message: None)
+        user_ids = [row[0] for row in db.session.query(User.id).filter(User.is_admin == False)]
+        backend = db.engine.url.get_backend_name()
+
+    mode = 'naive check-then-insert' if args.naive else 'reservations.reserve'
+    print(f'{mode}, {args.workers} {"processes" if args.processes else "threads"} x '
+          f'{args.requests} requests, {backend}')
+    print(f'{"cars":>5} {"booked":>7} {"conflicts":>9} {"busy":>5} {"bookings/s":>11} '
+          f'{"requests/s":>11} {"double bookings":>16}')
+    failed = False
+    for num_cars in levels:
+        booked, conflicts, busy, elapsed, doubles = run_round(num_cars, args, user_ids)
+        failed |= doubles > 0
+        print(f'{num_cars:>5} {booked:>7} {conflicts:>9} {busy:>5} {booked / elapsed:>11.0f} '
+              f'{(booked + conflicts + busy) / elapsed:>11.0f} {doubles:>16}')
+    if failed and not args.naive:
+        raise SystemExit('Double bookings found')
+
+
+if __name__ == '__main__':
+    main()
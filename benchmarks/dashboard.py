@@ -0,0 +1,88 @@
+"""
+Dashboard Benchmark
+Times the admin dashboard counters three ways against a seeded dataset:
+the previous five COUNT queries, the single aggregate statement, and the
+cached path, then measures end-to-end /admin/dashboard latency.
+
+    python -m benchmarks.dashboard --cars 10000 --bookings 1000000
+
+Uses BENCH_DATABASE_URL when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import use_bench_database
+
+use_bench_database()
+
+from app import app
+from models import db, User, Car, Booking
+import reports
+from benchmarks.availability import seed
+
+
+def five_counts():
+    return {
+        'total_cars': Car.query.count(),
+        'available_cars': Car.query.filter_by(is_available=True).count(),
+        'total_users': User.query.filter_by(is_admin=False).count(),
+        'total_bookings': Booking.query.count(),
+        'pending_bookings': Booking.query.filter_by(status='pending').count(),
+    }
+
+
+def timed(label, fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f'{label:<26} p50 {statistics.median(samples):>9.3f} ms   p99 {p99:>9.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cars', type=int, default=10000)
+    parser.add_argument('--bookings', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the existing database')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.cars, args.bookings)
+            reports.rebuild()
+        admin = User.query.filter_by(is_admin=True).first()
+        if admin is None:
+            admin = User(email='bench-admin@example.com', full_name='Bench Admin', is_admin=True)
+            admin.set_password('admin')
+            db.session.add(admin)
+            db.session.commit()
+        admin_id = admin.id
+
+        old, new = five_counts(), reports.query_dashboard_stats()
+        if old != new:
+            raise SystemExit(f'Counter mismatch:\n  old {old}\n  new {new}')
+
+        timed('five COUNT queries', five_counts, args.runs)
+        timed('single aggregate', reports.query_dashboard_stats, args.runs)
+        timed('cached', reports.dashboard_stats, args.runs)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin_id)
+        session['_fresh'] = True
+
+    def uncached_page():
+        reports.invalidate_dashboard()
+        client.get('/admin/dashboard')
+
+    timed('/admin/dashboard (cold)', uncached_page, args.runs)
+    timed('/admin/dashboard (warm)', lambda: client.get('/admin/dashboard'), args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Synthetic Data Generator
+Fills the database with a realistic fleet, customer base and booking
+history of any size, using bulk INSERTs in batches.
+
+    python -m benchmarks.datagen --cars 10000 --users 50000 --bookings 1000000
+
+* Cars are drawn from a Cambodian-market catalog; price, seats and fuel
+  follow the category, and about 5% are marked unavailable.
+* Customers sign up over the last two years; all share the password
+  ``password`` (emails customer<N>@example.com) and one admin
+  admin@example.com / admin is created.
+* Each car gets a timeline of non-overlapping bookings starting two years
+  ago and running into the next few months. Trips are mostly short with a
+  long tail, start more often on Fridays and Saturdays, are made one day to
+  a few weeks ahead, and get a status from where they fall relative to
+  today: completed or cancelled in the past, approved or pending ahead.
+  A timeline holds at most about 150 trips, so ask for no more than that
+  many bookings per car.
+
+The same --seed always produces the same data. Uses BENCH_DATABASE_URL
+when set, otherwise a throwaway SQLite file.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks import use_bench_database, reset_database
+
+use_bench_database()
+
+from werkzeug.security import generate_password_hash
+
+from app import app
+from models import db, User, Car, Booking
+from availability import availability
+from cache import page_cache
+from identity import user_cache
+from search import car_search
+import reports
+
+# (brand, model, category)
+CATALOG = [
+    ('Toyota', 'Camry', 'Sedan'), ('Toyota', 'Corolla', 'Sedan'), ('Honda', 'Civic', 'Sedan'),
+    ('Honda', 'Accord', 'Sedan'), ('Hyundai', 'Accent', 'Sedan'), ('Hyundai', 'Elantra', 'Sedan'),
+    ('Lexus', 'ES350', 'Sedan'), ('Kia', 'K5', 'Sedan'),
+    ('Toyota', 'Highlander', 'SUV'), ('Toyota', 'Fortuner', 'SUV'), ('Toyota', 'Land Cruiser', 'SUV'),
+    ('Lexus', 'RX300', 'SUV'), ('Ford', 'Explorer', 'SUV'), ('Ford', 'Everest', 'SUV'),
+    ('Hyundai', 'Santa Fe', 'SUV'), ('Mazda', 'CX-5', 'SUV'), ('Honda', 'CR-V', 'SUV'),
+    ('Toyota', 'Alphard', 'Van'), ('Toyota', 'HiAce', 'Van'), ('Hyundai', 'Starex', 'Van'),
+    ('Mercedes-Benz', 'V-Class', 'Van'), ('Kia', 'Carnival', 'Van'),
+    ('Toyota', 'Hilux', 'Pickup'), ('Ford', 'Ranger', 'Pickup'), ('Mitsubishi', 'Triton', 'Pickup'),
+    ('Isuzu', 'D-Max', 'Pickup'), ('Nissan', 'Navara', 'Pickup'),
+]
+
+# category: (price range in Riel per day, seat choices, fuel weights)
+CATEGORIES = {
+    'Sedan': ((80000, 200000), (5,), {'Petrol': 7, 'Hybrid': 3}),
+    'SUV': ((150000, 400000), (5, 7), {'Petrol': 5, 'Diesel': 4, 'Hybrid': 1}),
+    'Van': ((200000, 500000), (7, 12, 15), {'Diesel': 7, 'Petrol': 3}),
+    'Pickup': ((120000, 250000), (5,), {'Diesel': 9, 'Petrol': 1}),
+}
+
+DESCRIPTIONS = {
+    'Sedan': 'Comfortable and economical sedan, ideal for city driving and business trips.',
+    'SUV': 'Spacious SUV with plenty of room for family trips and provincial roads.',
+    'Van': 'Large van for group travel, airport transfers and long family journeys.',
+    'Pickup': 'Tough pickup built for countryside roads and carrying equipment.',
+}
+
+PROVINCES = ['PP', 'SR', 'BB', 'KP', 'KS', 'TK', 'KT', 'SHV']
+
+# Trip length in days and relative frequency: mostly short, a long tail
+TRIP_DAYS = list(range(1, 31))
+TRIP_WEIGHTS = [30, 26, 20, 14, 10, 8, 8] + [4] * 7 + [1.5] * 16
+# Monday..Sunday relative frequency of a trip's start day
+START_WEEKDAY_WEIGHTS = [0.8, 0.7, 0.7, 0.8, 1.5, 1.6, 1.0]
+
+HISTORY_DAYS = 730
+FUTURE_DAYS = 120
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _timestamp(rng, day):
+    return datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randrange(7 * 3600, 22 * 3600))
+
+
+def car_rows(rng, count):
+    rows = []
+    for i in range(count):
+        brand, model, category = rng.choice(CATALOG)
+        (low, high), seats, fuels = CATEGORIES[category]
+        rows.append({
+            'brand': brand,
+            'model': model,
+            'category': category,
+            'seat_capacity': rng.choice(seats),
+            'price_per_day': rng.randrange(low, high + 1, 5000),
+            'description': DESCRIPTIONS[category],
+            'fuel_type': _weighted(rng, fuels),
+            'transmission': 'Automatic' if rng.random() < 0.8 else 'Manual',
+            'year': rng.randint(2015, 2024),
+            'license_plate': f'{rng.choice(PROVINCES)}-{i:06d}',
+            'is_available': rng.random() >= 0.05,
+            'created_at': _timestamp(rng, date.today() - timedelta(days=rng.randrange(HISTORY_DAYS))),
+        })
+    return rows
+
+
+def user_rows(rng, count):
+    # One hash for everyone: generating a salted hash per user would dominate the run
+    password_hash = generate_password_hash('password')
+    rows = []
+    for i in range(count):
+        rows.append({
+            'email': f'customer{i}@example.com',
+            'password_hash': password_hash,
+            'full_name': f'Customer {i}',
+            'phone': f'0{rng.randint(10, 99)}{rng.randint(100000, 999999)}',
+            'is_admin': False,
+            'created_at': _timestamp(rng, date.today() - timedelta(days=rng.randrange(HISTORY_DAYS))),
+        })
+    return rows
+
+
+def car_timeline(rng, car_id, price, count, user_count, today):
+    """Yield up to count non-overlapping bookings of one car, oldest first."""
+    day = today - timedelta(days=HISTORY_DAYS)
+    last_day = today + timedelta(days=FUTURE_DAYS)
+    # Gap between trips so count bookings roughly fill the timeline
+    mean_gap = max(1.0, (HISTORY_DAYS + FUTURE_DAYS) / max(count, 1) - 4)
+    for _ in range(count):
+        day += timedelta(days=int(rng.expovariate(1 / mean_gap)))
+        # Nudge the start towards the busy weekdays
+        for _ in range(3):
+            if rng.random() * 1.6 < START_WEEKDAY_WEIGHTS[day.weekday()]:
+                break
+            day += timedelta(days=1)
+        days = rng.choices(TRIP_DAYS, weights=TRIP_WEIGHTS)[0]
+        start, end = day, day + timedelta(days=days)
+        if end > last_day:
+            return
+        booked = start - timedelta(days=min(60, 1 + int(rng.expovariate(1 / 10))))
+        if start > today:
+            status = 'approved' if rng.random() < 0.6 else 'pending'
+        elif end >= today:
+            status = 'approved'
+        else:
+            status = 'cancelled' if rng.random() < 0.12 else 'completed'
+        yield {
+            'user_id': rng.randint(2, user_count + 1),  # id 1 is the admin
+            'car_id': car_id,
+            'start_date': start,
+            'end_date': end,
+            'total_days': days,
+            'total_price': days * price,
+            'status': status,
+            'booking_date': _timestamp(rng, min(booked, today)),
+        }
+        day = end + timedelta(days=1)
+
+
+def generate(cars, users, bookings, seed=42, batch_size=20000, echo=print):
+    """Recreate the schema and fill it. Returns (cars, users, bookings) inserted."""
+    rng = random.Random(seed)
+    today = date.today()
+
+    reset_database(db)
+
+    admin = {'email': 'admin@example.com', 'password_hash': generate_password_hash('admin'),
+             'full_name': 'Admin', 'is_admin': True, 'created_at': datetime.utcnow()}
+    db.session.execute(db.insert(User), [admin])
+    for start in range(0, users, batch_size):
+        db.session.execute(db.insert(User), user_rows(rng, min(batch_size, users - start)))
+    car_data = car_rows(rng, cars)
+    for start in range(0, cars, batch_size):
+        db.session.execute(db.insert(Car), car_data[start:start + batch_size])
+    db.session.commit()
+    echo(f'  {cars:,} cars, {users:,} customers')
+
+    # Spread the bookings over the cars, some cars far busier than others
+    popularity = [rng.paretovariate(2.5) for _ in range(cars)]
+    scale = bookings / sum(popularity) if popularity else 0
+    inserted = 0
+    rows = []
+    for car_id, (car, weight) in enumerate(zip(car_data, popularity), start=1):
+        share = int(round(weight * scale))
+        for row in car_timeline(rng, car_id, car['price_per_day'], share, max(users, 1), today):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                db.session.execute(db.insert(Booking), rows)
+                inserted += len(rows)
+                rows = []
+    if rows:
+        db.session.execute(db.insert(Booking), rows)
+        inserted += len(rows)
+    db.session.commit()
+    echo(f'  {inserted:,} bookings')
+
+    # Bulk inserts bypass the ORM events that keep these current
+    reports.rebuild()
+    availability.invalidate()
+    car_search.rebuild()
+    page_cache.invalidate('catalog')
+    user_cache.invalidate()
+    return cars, users, inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cars', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--bookings', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with app.app_context():
+        generate(args.cars, args.users, args.bookings, args.seed, args.batch_size)
+    print(f'Generated in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Query Plan Check
+Runs EXPLAIN on the hot query shapes from app.py and fails if any of them
+reads a table with a full scan instead of an index.
+
+    python -m benchmarks.explain_check --cars 2000 --bookings 100000
+
+Uses BENCH_DATABASE_URL when set, otherwise a throwaway SQLite file. MySQL and
+SQLite plans are supported. Seed enough rows for the optimizer to prefer
+the indexes; on near-empty tables MySQL legitimately chooses full scans.
+"""
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+
+from benchmarks import use_bench_database
+
+use_bench_database()
+
+from app import app
+from models import db, User, Car, Booking, BookingDailyStat
+from availability import ACTIVE_STATUSES, filter_available
+from queries import (bookings_with_details, bookings_with_car, customers_with_booking_counts,
+                     BOOKING_KEY, CAR_KEY, CUSTOMER_KEY)
+from pagination import keyset_query
+import reports
+from benchmarks.availability import seed
+
+TABLES = {User.__tablename__, Car.__tablename__, Booking.__tablename__, BookingDailyStat.__tablename__}
+
+
+def hot_queries():
+    """(name, Query) pairs mirroring the statements the routes issue."""
+    start = date.today() + timedelta(days=10)
+    end = start + timedelta(days=3)
+    return [
+        ('book_car conflict check', db.session.query(Booking.id).filter(
+            Booking.car_id == 42, Booking.status.in_(ACTIVE_STATUSES),
+            Booking.start_date <= end, Booking.end_date >= start)),
+        ('availability index load', db.session.query(
+            Booking.id, Booking.start_date, Booking.end_date, Booking.status).filter(
+            Booking.car_id == 42, Booking.status.in_(ACTIVE_STATUSES))),
+        ('cars filtered listing', Car.query.filter_by(is_available=True, category='SUV')
+            .filter(Car.price_per_day >= 100000, Car.price_per_day <= 200000).limit(12)),
+        ('cars date-range search', filter_available(
+            Car.query.filter_by(is_available=True, category='SUV'), start, end).limit(12)),
+        ('index featured cars', Car.query.order_by(Car.created_at.desc()).limit(6)),
+        ('reports daily range', db.session.query(BookingDailyStat.day).filter(
+            BookingDailyStat.day.between(date.today() - timedelta(days=30), date.today()))),
+    ] + listing_queries()
+
+
+def listing_queries():
+    """The keyset listing pages: the first page and one reached through a cursor."""
+    now = datetime.utcnow()
+    listings = [
+        ('cars listing', Car.query.filter_by(is_available=True), CAR_KEY),
+        ('admin_cars', Car.query, CAR_KEY),
+        ('my_bookings', bookings_with_car().filter_by(user_id=1), BOOKING_KEY),
+        ('admin_bookings', bookings_with_details(), BOOKING_KEY),
+        ('admin_bookings by status', bookings_with_details().filter_by(status='pending'), BOOKING_KEY),
+        ('admin_customers', customers_with_booking_counts(), CUSTOMER_KEY),
+    ]
+    queries = []
+    for name, query, columns in listings:
+        queries.append((name, keyset_query(query, columns).limit(21)))
+        queries.append((f'{name} next page', keyset_query(query, columns, (now, 1000), 'next').limit(21)))
+    return queries
+
+
+def explain(connection, query):
+    """Return [(table, access, detail)] for a query's plan."""
+    compiled = query.statement.compile(
+        dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled.string}', params)
+        plan = []
+        for row in rows:
+            detail = row[-1]
+            words = detail.split()
+            table = words[1] if len(words) > 1 else ''
+            full_scan = words[0] == 'SCAN' and 'USING' not in detail
+            plan.append((table, 'ALL' if full_scan else words[0], detail))
+        return plan
+
+    if connection.dialect.name == 'mysql':
+        result = connection.exec_driver_sql(f'EXPLAIN {compiled.string}', params)
+        return [(row['table'], row['type'], row['Extra'] or '')
+                for row in result.mappings()]
+
+    raise SystemExit(f'EXPLAIN check does not support {connection.dialect.name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cars', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=100000)
+    parser.add_argument('--no-seed', action='store_true', help='reuse the existing database')
+    args = parser.parse_args()
+
+    failures = 0
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.cars, args.bookings)
+            reports.rebuild()
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'mysql':
+                connection.exec_driver_sql('ANALYZE TABLE users, cars, bookings, booking_daily_stats')
+            else:
+                connection.exec_driver_sql('ANALYZE')
+            for name, query in hot_queries():
+                scans = [(table, detail) for table, access, detail in explain(connection, query)
+                         if access == 'ALL' and table in TABLES]
+                failures += bool(scans)
+                print(f"{'FAIL' if scans else 'ok  '} {name}")
+                for table, detail in scans:
+                    print(f'       full scan of {table}: {detail}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
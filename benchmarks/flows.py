@@ -0,0 +1,197 @@
+"""
+Flow Benchmark
+Drives the Flask test client through the customer and admin flows and
+reports latency and SQL statements per step:
+
+    browse   anonymous /, /cars (page cache) and a logged-in customer's
+             /cars listing, filters, text search and a deep page
+    detail   /car/<id>
+    book     POST /book/<id> for free dates
+    approve  admin /admin/bookings?status=pending and the approve POST
+
+    python -m benchmarks.flows --iterations 200 --save before.json
+    ... change something ...
+    python -m benchmarks.flows --iterations 200 --compare before.json
+
+Every run first regenerates the same dataset with benchmarks.datagen (size
+set by --cars, --users and --bookings) and makes the same seeded random
+choices, so runs compare like for like. The flows write bookings, so
+--no-seed, which keeps the current database, is for one-off runs only.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from benchmarks import use_bench_database
+
+use_bench_database()
+
+from sqlalchemy import event
+
+from app import app
+from models import db, User, Car, Booking
+from benchmarks.datagen import generate, CATEGORIES
+
+CATEGORY_NAMES = sorted(CATEGORIES)
+SEARCH_TERMS = ['toyota', 'family', 'van', 'diesel pickup', 'lexus rx']
+
+
+class Recorder:
+    """Latency and statement count samples per step."""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.samples = {}
+        self._statements = 0
+
+    def _count(self, *args, **kwargs):
+        self._statements += 1
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._count)
+
+    def request(self, step, call, expect=(200, 302)):
+        self._statements = 0
+        started = time.perf_counter()
+        response = call()
+        elapsed = time.perf_counter() - started
+        if response.status_code not in expect:
+            raise RuntimeError(f'{step}: unexpected status {response.status_code}')
+        self.samples.setdefault(step, []).append((elapsed * 1000, self._statements))
+        return response
+
+    def summary(self):
+        results = {}
+        for step, samples in self.samples.items():
+            latencies = sorted(ms for ms, _ in samples)
+            results[step] = {
+                'requests': len(samples),
+                'p50_ms': statistics.median(latencies),
+                'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+                'queries': statistics.mean(queries for _, queries in samples),
+            }
+        return results
+
+
+def login(client, email, password):
+    response = client.post('/login', data={'email': email, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'login failed for {email}')
+
+
+def run_flows(recorder, iterations, rng, car_ids, customers):
+    anonymous = app.test_client()
+    admin = app.test_client()
+    login(admin, 'admin@example.com', 'admin')
+    booked = 0
+
+    for i in range(iterations):
+        # Browse
+        recorder.request('browse: / (anonymous)', lambda: anonymous.get('/'))
+        recorder.request('browse: /cars (anonymous)', lambda: anonymous.get('/cars'))
+
+        customer = app.test_client()
+        login(customer, rng.choice(customers), 'password')
+        recorder.request('browse: /cars', lambda: customer.get('/cars'))
+        category = rng.choice(CATEGORY_NAMES)
+        recorder.request('browse: /cars?category', lambda: customer.get(
+            f'/cars?category={category}&show_all=true'))
+        term = rng.choice(SEARCH_TERMS)
+        recorder.request('browse: /cars?query', lambda: customer.get(f'/cars?query={term}'))
+        recorder.request('browse: /cars?page=20', lambda: customer.get('/cars?page=20&show_all=true'))
+
+        # Detail
+        car_id = rng.choice(car_ids)
+        recorder.request('detail: /car/<id>', lambda: customer.get(f'/car/{car_id}'))
+
+        # Book dates past the generated timeline, so most requests succeed
+        start = date.today() + timedelta(days=200 + rng.randrange(1000))
+        end = start + timedelta(days=rng.randint(1, 7))
+        response = recorder.request('book: POST /book/<id>', lambda: customer.post(
+            f'/book/{car_id}', data={'start_date': start.isoformat(), 'end_date': end.isoformat()}))
+        if response.location and 'my-bookings' in response.location:
+            booked += 1
+
+        # Approve
+        recorder.request('approve: pending list', lambda: admin.get('/admin/bookings?status=pending'))
+        with app.app_context():
+            booking_id = db.session.query(Booking.id).filter(
+                Booking.car_id == car_id, Booking.status == 'pending'
+            ).order_by(Booking.id.desc()).limit(1).scalar()
+        if booking_id is not None:
+            recorder.request('approve: POST approve', lambda: admin.post(
+                f'/admin/booking/approve/{booking_id}'))
+    return booked
+
+
+def print_summary(results, baseline=None):
+    header = f'{"step":<28} {"n":>5} {"p50 ms":>9} {"p99 ms":>9} {"queries":>8}'
+    if baseline:
+        header += f'  {"p50 vs base":>12} {"queries vs base":>16}'
+    print(header)
+    for step, row in results.items():
+        line = (f'{step:<28} {row["requests"]:>5} {row["p50_ms"]:>9.2f} '
+                f'{row["p99_ms"]:>9.2f} {row["queries"]:>8.1f}')
+        base = (baseline or {}).get(step)
+        if base:
+            change = (row['p50_ms'] / base['p50_ms'] - 1) * 100 if base['p50_ms'] else 0.0
+            line += f'  {change:>+11.0f}% {row["queries"] - base["queries"]:>+16.1f}'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-seed', action='store_true', help='use the existing benchmarks.datagen data')
+    parser.add_argument('--cars', type=int, default=500)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='show changes against saved results')
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    with app.app_context():
+        if not args.no_seed:
+            generate(args.cars, args.users, args.bookings)
+        car_ids = [row[0] for row in db.session.query(Car.id).order_by(Car.id)]
+        customers = [row[0] for row in db.session.query(User.email)
+                     .filter(User.is_admin == False, User.email.like('customer%@example.com'))
+                     .order_by(User.id).limit(1000)]
+        engines = list(db.engines.values())
+    if not car_ids or not customers:
+        sys.exit('No generated data found; run without --no-seed or run benchmarks.datagen first.')
+
+    started = time.perf_counter()
+    with Recorder(engines) as recorder:
+        booked = run_flows(recorder, args.iterations, random.Random(args.seed), car_ids, customers)
+    elapsed = time.perf_counter() - started
+    results = recorder.summary()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['steps']
+    print(f'{args.iterations} iterations in {elapsed:.1f}s, {booked} bookings made')
+    print_summary(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'iterations': args.iterations, 'database': engines[0].url.get_backend_name(),
+                       'steps': results}, f, indent=2)
+        print(f'Saved to {args.save}')
+
+
+if __name__ == '__main__':
+    main()
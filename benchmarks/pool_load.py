@@ -0,0 +1,124 @@
+"""
+Connection Pool Load Test
+Throughput of a request-shaped workload as the pool size varies.
+
+    python -m benchmarks.pool_load --threads 32 --sizes 1,2,5,10,20
+
+Each simulated request checks a connection out, runs the catalog listing
+and an availability conflict check, holds the connection for --hold-ms
+(template rendering while the session is still open) and returns it.
+Every pool size gets a fresh engine with the same options as the app, and
+the table shows requests/s with checkout wait percentiles and timeouts.
+
+Uses BENCH_DATABASE_URL when set, otherwise a throwaway SQLite file. Run it
+against MySQL to size DB_POOL_SIZE: SQLite serialises writers but this
+workload only reads.
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from benchmarks import use_bench_database
+
+use_bench_database()
+
+from sqlalchemy import create_engine, exc, select
+from sqlalchemy.orm import Session
+
+from app import app
+from models import db, Car, Booking
+from availability import ACTIVE_STATUSES
+from dbpool import MeteredQueuePool, pool_metrics
+from benchmarks.availability import seed
+
+
+def request_workload(engine, rng, num_cars, hold):
+    with Session(engine) as session:
+        session.execute(
+            select(Car).filter(Car.is_available == True)
+            .order_by(Car.created_at.desc(), Car.id.desc()).limit(12)
+        ).all()
+        car_id = rng.randint(1, num_cars)
+        start = date.today() + timedelta(days=rng.randrange(60))
+        session.execute(
+            select(Booking.id).filter(
+                Booking.car_id == car_id,
+                Booking.status.in_(ACTIVE_STATUSES),
+                Booking.start_date <= start + timedelta(days=3),
+                Booking.end_date >= start
+            ).limit(1)
+        ).first()
+        if hold:
+            time.sleep(hold)
+
+
+def run(pool_size, args, num_cars):
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': 0,
+        'pool_timeout': args.pool_timeout,
+        'pool_pre_ping': app.config.get('DB_POOL_PRE_PING', True),
+    }
+    options.update({k: v for k, v in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).items()
+                    if k in ('connect_args', 'pool_recycle', 'pool_use_lifo')})
+    engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], **options)
+    pool_metrics.reset()
+    errors = []
+    completed = [0] * args.threads
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(index):
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            try:
+                request_workload(engine, rng, num_cars, args.hold_ms / 1000)
+                completed[index] += 1
+            except exc.TimeoutError:
+                pass
+            except exc.SQLAlchemyError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = pool_metrics.snapshot(engine)
+    engine.dispose()
+
+    print(f'{pool_size:>5} {sum(completed) / elapsed:>10,.0f} '
+          f'{stats["wait_p50_ms"]:>9.2f} {stats["wait_p99_ms"]:>9.2f} {stats["wait_max_ms"]:>9.1f} '
+          f'{stats["timeouts"]:>8} {stats["connects"]:>8}'
+          + (f'  ({len(errors)} errors, first: {errors[0]})' if errors else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='1,2,5,10,20', help='comma separated pool sizes')
+    parser.add_argument('--threads', type=int, default=32, help='concurrent simulated requests')
+    parser.add_argument('--seconds', type=float, default=3.0, help='duration of each run')
+    parser.add_argument('--hold-ms', type=float, default=2.0, help='time a request keeps its connection')
+    parser.add_argument('--pool-timeout', type=float, default=5.0)
+    parser.add_argument('--cars', type=int, default=500)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--no-seed', action='store_true', help='use the existing database as is')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not args.no_seed:
+            seed(args.cars, args.bookings)
+        num_cars = db.session.query(db.func.max(Car.id)).scalar() or 1
+
+    print(f'{args.threads} threads, {args.hold_ms:g} ms hold, {args.seconds:g} s per pool size')
+    print(f'{"pool":>5} {"req/s":>10} {"p50 ms":>9} {"p99 ms":>9} {"max ms":>9} {"timeouts":>8} {"connects":>8}')
+    for size in (int(s) for s in args.sizes.split(',')):
+        run(size, args, num_cars)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Query Count Check
+Renders the listing pages against a seeded database and fails if any page
+issues more SQL statements than its budget. A page that regresses into
+per-row lazy loading shows up here as a count that grows with the data.
+
+    python -m benchmarks.query_counts
+
+Uses BENCH_DATABASE_URL when set, otherwise an in-memory SQLite database.
+"""
+import sys
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from benchmarks import use_bench_database, reset_database
+
+use_bench_database('sqlite://')
+
+from sqlalchemy import event
+
+from app import app
+from models import db, User, Car, Booking
+
+# Maximum statements per page, including the user lookup by Flask-Login
+# (only on the first page per role; later ones hit identity.user_cache)
+PAGE_BUDGETS = {
+    ('customer', '/my-bookings'): 3,
+    ('admin', '/admin/bookings'): 3,
+    ('admin', '/admin/bookings?status=pending'): 3,
+    ('admin', '/admin/customers'): 3,
+    ('admin', '/admin/dashboard'): 3,
+}
+
+
+@contextmanager
+def count_queries(engine):
+    """Yield a list that receives every SQL statement run inside the block."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed(num_customers=25, num_cars=15, bookings_per_customer=4):
+    reset_database(db)
+    admin = User(email='admin@example.com', full_name='Admin', is_admin=True)
+    admin.set_password('admin')
+    db.session.add(admin)
+    cars = [Car(brand='Brand', model=f'Model {i}', category='Sedan', seat_capacity=5,
+                price_per_day=100000, license_plate=f'QC-{i:04d}') for i in range(num_cars)]
+    db.session.add_all(cars)
+    start = date.today() + timedelta(days=30)
+    for i in range(num_customers):
+        customer = User(email=f'customer{i}@example.com', full_name=f'Customer {i}', phone='012345678')
+        customer.set_password('password')
+        db.session.add(customer)
+        for j in range(bookings_per_customer):
+            car = cars[(i * bookings_per_customer + j) % num_cars]
+            begin = start + timedelta(days=j * 10)
+            db.session.add(Booking(customer=customer, car=car, start_date=begin,
+                                   end_date=begin + timedelta(days=3), total_days=3,
+                                   total_price=3 * car.price_per_day))
+    db.session.commit()
+    return admin.id, customer.id
+
+
+def main():
+    app.config['WTF_CSRF_ENABLED'] = False
+    failures = 0
+    with app.app_context():
+        user_ids = dict(zip(('admin', 'customer'), seed()))
+        engine = db.engine
+
+    for (role, url), budget in PAGE_BUDGETS.items():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_ids[role])
+            session['_fresh'] = True
+        with count_queries(engine) as statements:
+            response = client.get(url)
+        ok = response.status_code == 200 and len(statements) <= budget
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {url:<34} {response.status_code} "
+              f'{len(statements):>3} queries (budget {budget})')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Replica Routing Check
+Runs the app against two SQLite files standing in for a primary and a
+replica and checks where each request's queries go:
+
+* anonymous catalog pages read from the replica
+* booking writes go to the primary
+* right after booking, the customer's reads stay on the primary
+* once REPLICA_READ_YOUR_WRITES has passed, their reads use the replica
+
+    python -m benchmarks.replica_routing
+
+Exits non-zero if any request is routed to the wrong database.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+_dir = tempfile.mkdtemp(prefix='car_rental_replicas_')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(_dir, "primary.db")}'
+os.environ['DATABASE_REPLICA_URLS'] = f'sqlite:///{os.path.join(_dir, "replica.db")}'
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Car, Booking
+from replicas import replicas, sync_sqlite
+import init_db
+
+WINDOW = 1  # seconds, shortened REPLICA_READ_YOUR_WRITES
+
+
+def route_of(engines, fn):
+    """Run fn and return the set of databases ('primary'/'replica') it queried."""
+    used = set()
+    listeners = []
+    for key, engine in engines.items():
+        name = 'primary' if key is None else 'replica'
+
+        def before_cursor_execute(*args, _name=name, **kwargs):
+            used.add(_name)
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        listeners.append((engine, before_cursor_execute))
+    try:
+        response = fn()
+    finally:
+        for engine, listener in listeners:
+            event.remove(engine, 'before_cursor_execute', listener)
+    return response, used
+
+
+def main():
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['RATELIMIT_ENABLED'] = False
+    replicas.read_your_writes = WINDOW
+    init_db.init_database()
+    with app.app_context():
+        engines = dict(db.engines)
+        sync_sqlite(engines[None], engines['replica1'])
+        car_id = Car.query.filter_by(is_available=True).first().id
+
+    client = app.test_client()
+    start = date.today() + timedelta(days=90)
+    checks = [
+        ('anonymous /cars', lambda: client.get('/cars?show_all=true'), {'replica'}),
+        (f'anonymous /car/{car_id}', lambda: client.get(f'/car/{car_id}'), {'replica'}),
+        ('customer login', lambda: client.post('/login', data={
+            'email': 'customer@example.com', 'password': 'password123'}), {'primary'}),
+        ('customer books', lambda: client.post(f'/book/{car_id}', data={
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=2)).isoformat()}), {'primary'}),
+        ('car page right after booking', lambda: client.get(f'/car/{car_id}'), {'primary'}),
+        ('car page after the window', lambda: (time.sleep(WINDOW + 0.2), client.get(f'/car/{car_id}'))[1],
+         {'replica'}),
+    ]
+
+    failures = 0
+    for label, fn, expected in checks:
+        response, used = route_of(engines, fn)
+        ok = used == expected and response.status_code in (200, 302)
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label:<32} {response.status_code}  '
+              f'{"+".join(sorted(used)) or "no queries"} (expected {"+".join(sorted(expected))})')
+
+    with app.app_context():
+        on_primary = Booking.query.count()
+        replicas_engine = engines['replica1']
+        with replicas_engine.connect() as connection:
+            on_replica = connection.execute(db.select(db.func.count(Booking.id))).scalar()
+    print(f'bookings on primary: {on_primary}, on the unsynced replica: {on_replica}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Search Filter Check
+Searches a catalog where more cars match the text than SEARCH_MAX_RESULTS
+and fails if a narrow category, price band or date filter loses matches
+to the in-memory index's cap, on /cars and on /api/v1/cars.
+
+    python -m benchmarks.search_check
+
+Uses BENCH_DATABASE_URL when set, otherwise an in-memory SQLite database.
+"""
+import os
+import re
+import sys
+from datetime import date, datetime, timedelta
+
+from benchmarks import use_bench_database, reset_database
+
+use_bench_database('sqlite://')
+# The cap only exists in the in-memory index
+os.environ['SEARCH_BACKEND'] = 'python'
+
+from app import app
+from models import db, User, Car, Booking
+from search import car_search
+
+PRICE = 100000
+# Rare cars get the highest ids, which rank last among equally good matches
+RARE_CARS = 5
+
+
+def seed():
+    """Insert 2 x SEARCH_MAX_RESULTS Toyotas, the last RARE_CARS of them SUVs.
+
+    Returns the SUV ids and the start date of the booking that takes the
+    first of them a month from now.
+    """
+    reset_database(db)
+    total = car_search.max_results * 2
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Car), [{
+        'brand': 'Toyota', 'model': 'Hilux', 'category': 'SUV' if i >= total - RARE_CARS else 'Pickup',
+        'seat_capacity': 5, 'price_per_day': PRICE * 2 if i == total - 1 else PRICE,
+        'description': 'Four-wheel drive', 'license_plate': f'SC-{i:05d}', 'is_available': True,
+        'created_at': now
+    } for i in range(total)])
+    db.session.execute(db.insert(User), [{
+        'email': 'search@example.com', 'password_hash': '-', 'full_name': 'Search Check'
+    }])
+    suv_ids = [car_id for (car_id,) in db.session.query(Car.id).filter(Car.category == 'SUV').order_by(Car.id)]
+    start = date.today() + timedelta(days=30)
+    db.session.execute(db.insert(Booking), [{
+        'user_id': 1, 'car_id': suv_ids[0], 'start_date': start, 'end_date': start + timedelta(days=3),
+        'total_days': 3, 'total_price': 3 * PRICE, 'status': 'approved', 'booking_date': now
+    }])
+    db.session.commit()
+    car_search.rebuild()
+    return suv_ids, start
+
+
+def main():
+    with app.app_context():
+        suv_ids, start = seed()
+    dates = {'start_date': (start + timedelta(days=1)).isoformat(),
+             'end_date': (start + timedelta(days=2)).isoformat()}
+    cases = [
+        ('category', {'category': 'SUV'}, suv_ids),
+        ('category and price band', {'category': 'SUV', 'min_price': PRICE * 2}, suv_ids[-1:]),
+        ('category and free dates', dict(dates, category='SUV'), suv_ids[1:]),
+    ]
+
+    failures = 0
+    client = app.test_client()
+    for name, filters, expected in cases:
+        args = dict(filters, query='toyota')
+        html = client.get('/cars', query_string=args).get_data(as_text=True)
+        page_ids = {int(car_id) for car_id in re.findall(r'href="/car/(\d+)"', html)}
+        api = client.get('/api/v1/cars', query_string=dict(args, limit=100)).get_json()
+        api_ids = {car['id'] for car in api['data']}
+        for source, found in (('/cars', page_ids), ('/api/v1/cars', api_ids)):
+            ok = found == set(expected)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {source:<13} {name:<24} {len(found)} of {len(expected)} cars")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Page Cache
+Response cache for the public catalog pages with tag-based invalidation.
+
+Each cached entry is keyed by the request path, its query arguments and the
+current version of every tag the view depends on. Invalidating a tag bumps
+its version, so every entry built against the old version stops matching
+and simply ages out of the backend.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+
+class NullBackend:
+    """Backend that stores nothing (caching disabled)."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend:
+    """In-process LRU cache with per-entry TTL.
+
+    Counters created by incr() are kept outside the LRU so a tag version is
+    never evicted and reset while entries built against it are still cached.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters.get(key, 0) + 1
+            self._counters[key] = value
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class FileSystemBackend:
+    """Cache stored as one pickle file per key, shared by all worker processes."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires_at, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def incr(self, key):
+        # Read-modify-write is not atomic across processes, but two racing
+        # increments still move the version away from the invalidated one.
+        value = (self.get(key) or 0) + 1
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def make_backend(app, prefix):
+    """Build the backend named by <prefix>_BACKEND in the app config."""
+    name = app.config.get(f'{prefix}_BACKEND', 'memory')
+    if name == 'memory':
+        return MemoryBackend(app.config.get(f'{prefix}_MAX_ENTRIES', 512))
+    if name == 'filesystem':
+        directory = app.config.get(f'{prefix}_DIR') or os.path.join(
+            tempfile.gettempdir(), f'car_rental_{prefix.lower()}')
+        return FileSystemBackend(directory)
+    if name in (None, 'null'):
+        return NullBackend()
+    raise ValueError(f'Unknown {prefix}_BACKEND: {name!r}')
+
+
+class PageCache:
+    """Caches rendered pages for anonymous visitors."""
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.ttl = 300
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_backend(app, 'PAGE_CACHE')
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        app.extensions['page_cache'] = self
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def invalidate(self, *tags):
+        """Expire every cached page that depends on any of the given tags."""
+        for tag in tags:
+            self.backend.incr(f'tag:{tag}')
+            self.invalidations += 1
+
+    def _key(self, tags):
+        versions = ','.join(f'{tag}={self.backend.get(f"tag:{tag}") or 0}' for tag in tags)
+        args = urlencode(sorted(request.args.items(multi=True)))
+        return f'page:{request.path}?{args}|{versions}'
+
+    def _cacheable(self, unless):
+        if request.method != 'GET' or current_user.is_authenticated:
+            return False
+        # A pending flash message is rendered into the page and is per-visitor
+        if session.get('_flashes'):
+            return False
+        return not (unless and unless())
+
+    def cached(self, tags, unless=None):
+        """Cache a view's response under tags formatted with its URL arguments.
+
+        For example ``tags=('car:{car_id}',)`` on a view taking ``car_id``.
+        Authenticated users, non-GET requests and requests for which
+        ``unless()`` returns true always get a freshly rendered page.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self._cacheable(unless):
+                    return view(*args, **kwargs)
+
+                key = self._key([tag.format(**kwargs) for tag in tags])
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    data, status, mimetype = entry
+                    response = current_app.response_class(data, status=status, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self.misses += 1
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    self.backend.set(key, (response.get_data(), response.status_code, response.mimetype), self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+
+page_cache = PageCache()
@@ -12,14 +12,123 @@ class Config:
     DB_PASSWORD = os.environ.get('DATABASE_PASSWORD') or ''
     DB_NAME = os.environ.get('DATABASE_NAME') or 'car_rental_db'
     
-    SQLALCHEMY_DATABASE_URI = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+        f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read replicas, comma separated URLs; read-only views query them
+    DB_REPLICA_URLS = [url.strip() for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = {f'replica{i}': url for i, url in enumerate(DB_REPLICA_URLS, 1)}
+    REPLICA_READ_YOUR_WRITES = 5  # seconds a visitor reads from the primary after writing
+    REPLICA_MAX_LAG = 10  # seconds of replication lag before a replica is skipped
+    REPLICA_LAG_CHECK_INTERVAL = 5  # seconds between lag checks per replica
+    
+    # Connection pool, per worker process. Keep
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below MySQL's max_connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 5)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)  # below MySQL wait_timeout
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT') or 5)
+    DB_POOL_METRICS = True  # time checkouts, see /admin/pool-stats
+    
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+    else:
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE,
+            'pool_pre_ping': DB_POOL_PRE_PING,
+            'pool_use_lifo': True,  # lets idle connections above the busy set time out
+        }
+        if SQLALCHEMY_DATABASE_URI.startswith('mysql'):
+            SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'connect_timeout': DB_CONNECT_TIMEOUT}
+    
     # Upload configuration
     UPLOAD_FOLDER = 'static/uploads/cars'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+    IMAGE_MANIFEST_TTL = 60  # seconds between rescans of the image folders
+    IMAGE_CACHE_SIZE = 1024  # cached (brand, model, image) resolutions
+    
+    # Image derivatives (resized WebP/AVIF copies, needs Pillow)
+    IMAGE_PIPELINE_ENABLED = True
+    IMAGE_PIPELINE_WORKERS = 2
+    IMAGE_DERIVATIVE_WIDTHS = (320, 640, 1024)
+    IMAGE_DERIVATIVE_QUALITY = 80
     
     # Pagination
     CARS_PER_PAGE = 12
     BOOKINGS_PER_PAGE = 10
+    PAGINATION_MODE = 'keyset'  # 'keyset' (cursor links) or 'offset'
+    PAGINATION_COUNT_TTL = 60  # seconds a listing's total count is reused
+    
+    # Concurrent bookings of the same car (reservations.py)
+    BOOKING_MAX_RETRIES = 5
+    BOOKING_RETRY_BACKOFF = 0.01  # seconds, doubled on every retry
+    
+    # Booking lifecycle (lifecycle.py): seconds between in-process passes, 0 to
+    # leave it to `flask lifecycle run` from cron or a daemon
+    LIFECYCLE_INTERVAL = int(os.environ.get('LIFECYCLE_INTERVAL') or 0)
+    LIFECYCLE_BATCH_SIZE = 1000
+    
+    # Pricing rules (pricing.py); with none, a rental costs total_days * price_per_day
+    PRICING_RULES = {
+        'seasons': [],      # {'start': '2026-12-20', 'end': '2027-01-05', 'multiplier': 1.3}
+        'weekdays': {},     # {'sat': 1.15, 'sun': 1.15}
+        'durations': [],    # [(7, 0.9), (30, 0.8)]: multiplier by rental length in days
+        'categories': {},   # {'SUV': {'weekdays': {'sat': 1.25}}}: replaces tables per category
+    }
+    
+    # Page cache for public catalog pages: 'memory', 'filesystem' or 'null'
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND') or 'memory'
+    PAGE_CACHE_TTL = 300  # seconds
+    PAGE_CACHE_MAX_ENTRIES = 512  # memory backend only
+    PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR')  # filesystem backend, defaults to a temp dir
+    
+    # JSON API (/api/v1)
+    API_PAGE_SIZE = 20
+    API_MAX_PAGE_SIZE = 100
+    API_CACHE_MAX_AGE = 60  # seconds clients and CDNs may reuse a car response
+    CALENDAR_CACHE_MAX_AGE = 30  # seconds a car's booked-days calendar may be reused
+    
+    # Admin dashboard counters cache
+    DASHBOARD_CACHE_TTL = 30  # seconds
+    
+    # Car search: 'auto' (MySQL FULLTEXT when the index exists, else in-memory), 'python' or 'like'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    SEARCH_INDEX_TTL = 300  # seconds before the in-memory index is rebuilt
+    SEARCH_MAX_RESULTS = 1000  # best text matches kept, after the other catalog filters
+    
+    # Request instrumentation: Server-Timing header, /metrics, slow query log, profiling
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'false').lower() == 'true'
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS') or 200)  # 0 disables the slow query log
+    PROFILE_ROUTES = [name.strip() for name in (os.environ.get('PROFILE_ROUTES') or '').split(',') if name.strip()]
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')  # defaults to a temp dir
+    # Who may read /metrics: these addresses or networks, plus bearer token holders when set
+    METRICS_ALLOWED_IPS = [address.strip() for address in
+                           (os.environ.get('METRICS_ALLOWED_IPS') or '127.0.0.1,::1').split(',') if address.strip()]
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Rate limiting (token buckets) for login, registration and booking POSTs
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    RATELIMIT_STORE = os.environ.get('RATELIMIT_STORE') or 'memory'  # 'memory' (per process) or 'sqlite'
+    RATELIMIT_SQLITE_PATH = os.environ.get('RATELIMIT_SQLITE_PATH')  # defaults to a temp dir
+    RATELIMITS = {
+        'login:ip': '20/minute',
+        'login:email': '5/minute',
+        'register:ip': '5/hour',
+        'book:user': '10/minute',
+    }
+    
+    # Logged-in user lookups (identity.py)
+    USER_CACHE_ENABLED = os.environ.get('USER_CACHE_ENABLED', 'true').lower() == 'true'
+    USER_CACHE_TTL = 60  # seconds; changes made by other workers show up after this
+    USER_CACHE_SIZE = 10000
+    
+    # Availability index (in-memory booking conflict detection)
+    AVAILABILITY_INDEX_ENABLED = os.environ.get('AVAILABILITY_INDEX_ENABLED', 'true').lower() == 'true'
+    AVAILABILITY_INDEX_TTL = 300  # seconds before a car's cached bookings are reloaded
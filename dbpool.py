@@ -0,0 +1,129 @@
+"""
+Connection Pool Metrics
+Per-worker view of SQLAlchemy connection pool pressure.
+
+The engine is built with MeteredQueuePool, which times every checkout
+(waiting for a free connection, the pre-ping and any reconnect) and counts
+checkout timeouts. Pool events add the number of connections opened,
+returned and invalidated. Each gunicorn worker has its own pool, so the
+numbers are per process and are reported together with the worker's pid.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+# Recent checkout times kept for the percentiles
+SAMPLE_SIZE = 2048
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that reports how long each checkout took."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.record_timeout(time.perf_counter() - started)
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - started)
+        return connection
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PoolMetrics:
+    """Counters for the pool of this worker process."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Use MeteredQueuePool for the app's engine. Call before db.init_app()."""
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        # In-memory SQLite needs its single shared connection pool
+        if app.config.get('DB_POOL_METRICS', True) and uri not in ('sqlite://', 'sqlite:///:memory:'):
+            options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+            options.setdefault('poolclass', MeteredQueuePool)
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+        app.extensions['pool_metrics'] = self
+        if not event.contains(MeteredQueuePool, 'connect', self._on_connect):
+            event.listen(MeteredQueuePool, 'connect', self._on_connect)
+            event.listen(MeteredQueuePool, 'checkin', self._on_checkin)
+            event.listen(MeteredQueuePool, 'invalidate', self._on_invalidate)
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+            self._samples = deque(maxlen=SAMPLE_SIZE)
+
+    def record_checkout(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+            self._samples.append(seconds)
+
+    def record_timeout(self, seconds):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_total += seconds
+            if seconds > self.wait_max:
+                self.wait_max = seconds
+
+    def snapshot(self, engine=None):
+        """Counters, checkout time percentiles (ms) and the live pool state."""
+        with self._lock:
+            ordered = sorted(self._samples)
+            stats = {
+                'pid': os.getpid(),
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+                'wait_p50_ms': _percentile(ordered, 0.50) * 1000,
+                'wait_p99_ms': _percentile(ordered, 0.99) * 1000,
+                'wait_max_ms': self.wait_max * 1000,
+            }
+        pool = engine.pool if engine is not None else None
+        if isinstance(pool, QueuePool):
+            stats.update(pool_size=pool.size(), checked_out=pool.checkedout(),
+                         overflow=max(pool.overflow(), 0), idle=pool.checkedin())
+        return stats
+
+    # Pool event handlers
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+
+pool_metrics = PoolMetrics()
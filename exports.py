@@ -0,0 +1,112 @@
+"""
+CSV Exports
+Streaming CSV downloads of bookings, customers and the report rollups.
+
+Each export runs one column-only SELECT with ``yield_per``, which makes the
+driver use a server-side cursor, and writes the rows through a generator
+response a batch at a time. Memory stays constant however many rows there
+are and the first bytes go out as soon as the first batch is fetched.
+Files start with a UTF-8 byte order mark so Excel reads them as UTF-8.
+Text cells that a spreadsheet would run as a formula get a leading quote.
+"""
+import csv
+import io
+from datetime import date
+
+from flask import Response, stream_with_context
+from sqlalchemy import func
+
+from models import db, User, Car, Booking, BookingDailyStat
+
+# Rows fetched from the cursor at a time, and written per response chunk
+BATCH_SIZE = 1000
+# First characters that make Excel and LibreOffice read a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+BOOKING_COLUMNS = (
+    ('booking_id', Booking.id),
+    ('booking_date', Booking.booking_date),
+    ('status', Booking.status),
+    ('customer_name', User.full_name),
+    ('customer_email', User.email),
+    ('customer_phone', User.phone),
+    ('brand', Car.brand),
+    ('model', Car.model),
+    ('license_plate', Car.license_plate),
+    ('start_date', Booking.start_date),
+    ('end_date', Booking.end_date),
+    ('total_days', Booking.total_days),
+    ('total_price', Booking.total_price),
+    ('notes', Booking.notes),
+)
+
+
+def bookings_export(status=None):
+    """Bookings with customer and car, newest first, optionally for one status."""
+    query = db.select(*(column for _, column in BOOKING_COLUMNS))\
+        .join(User, User.id == Booking.user_id)\
+        .join(Car, Car.id == Booking.car_id)\
+        .order_by(Booking.booking_date.desc(), Booking.id.desc())
+    if status:
+        query = query.where(Booking.status == status)
+    return [name for name, _ in BOOKING_COLUMNS], query
+
+
+def customers_export():
+    """Customers with their booking count and total spent, newest first."""
+    totals = db.select(
+        Booking.user_id.label('user_id'),
+        func.count(Booking.id).label('bookings'),
+        func.sum(Booking.total_price).label('total_spent')
+    ).group_by(Booking.user_id).subquery()
+    query = db.select(
+        User.id, User.full_name, User.email, User.phone, User.created_at,
+        func.coalesce(totals.c.bookings, 0), func.coalesce(totals.c.total_spent, 0)
+    ).outerjoin(totals, totals.c.user_id == User.id)\
+     .where(User.is_admin == False)\
+     .order_by(User.created_at.desc(), User.id.desc())
+    return ['customer_id', 'full_name', 'email', 'phone', 'registered_at', 'bookings', 'total_spent'], query
+
+
+def rollups_export(start_date, end_date):
+    """Daily rollup rows per car and status between two dates (inclusive)."""
+    query = db.select(
+        BookingDailyStat.day, Car.id, Car.brand, Car.model, Car.license_plate,
+        BookingDailyStat.status, BookingDailyStat.bookings, BookingDailyStat.revenue
+    ).join(Car, Car.id == BookingDailyStat.car_id)\
+     .where(BookingDailyStat.day.between(start_date, end_date), BookingDailyStat.bookings != 0)\
+     .order_by(BookingDailyStat.day, Car.id, BookingDailyStat.status)
+    return ['day', 'car_id', 'brand', 'model', 'license_plate', 'status', 'bookings', 'revenue'], query
+
+
+def _escape_formula(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(header, query, batch_size=BATCH_SIZE):
+    """Yield CSV text for the query's rows, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    result = db.session.execute(query.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        writer.writerows([_escape_formula(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def csv_response(name, header, query):
+    """Stream the query as a CSV attachment named <name>-<today>.csv."""
+    filename = f'{name}-{date.today().isoformat()}.csv'
+    response = Response(stream_with_context(iter_csv(header, query)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Tell nginx to pass chunks through instead of buffering the whole file
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,390 @@
+"""
+Fleet Import
+Bulk loading of cars and historical bookings from CSV or JSON files.
+
+    flask fleet import-cars fleet.csv
+    flask fleet import-cars fleet.json --on-duplicate update
+    flask fleet import-bookings history.jsonl
+
+Files are streamed and handled in chunks: each chunk is validated, checked
+against the database and written with one executemany INSERT, then
+committed, so memory use does not grow with the file. Car rows go through
+CarForm, so an import accepts exactly what the admin form accepts.
+Duplicate license plates, in the file or already in the database, are
+skipped or update the existing car with the columns the row fills in.
+
+CSV files need a header row. JSON can be a top-level array of objects
+(.json) or one object per line (.jsonl / .ndjson).
+"""
+import csv
+import json
+import os
+import time
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+
+from models import db, User, Car, Booking
+from forms import CarForm
+from availability import availability, ACTIVE_STATUSES
+from approvals import Timeline
+from cache import page_cache
+from search import car_search
+from replicas import use_primary
+import reports
+
+CAR_FIELDS = ('brand', 'model', 'category', 'seat_capacity', 'price_per_day', 'fuel_type',
+              'transmission', 'year', 'license_plate', 'description', 'is_available')
+BOOKING_STATUSES = ('pending', 'approved', 'cancelled', 'completed', 'expired')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+# Values for optional columns a row leaves out, used for new cars only;
+# updates leave those columns of the existing car as they are
+INSERT_DEFAULTS = {'description': None, 'is_available': True, 'image_url': 'default-car.jpg'}
+# Errors listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    """Yield the objects of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        if not eof and len(buffer) < chunk_size:
+            data = f.read(chunk_size)
+            eof = not data
+            buffer += data
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer:
+                return
+            if buffer[0] != '[':
+                raise ValueError('expected a JSON array of objects')
+            buffer = buffer[1:]
+            started = True
+            continue
+        buffer = buffer.lstrip(', \t\r\n')
+        if buffer.startswith(']'):
+            return
+        if not buffer:
+            if eof:
+                raise ValueError('unterminated JSON array')
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            data = f.read(chunk_size)
+            eof = not data
+            buffer += data
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+
+def read_rows(path, file_format=None):
+    """Yield one dict per record of a CSV, JSON array or JSON Lines file."""
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+        elif file_format in ('jsonl', 'ndjson'):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif file_format == 'json':
+            yield from _iter_json_array(f)
+        else:
+            raise click.BadParameter(f'unsupported file format {file_format!r}, use csv, json or jsonl')
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ImportReport:
+    """Counts what happened to every row of an import."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'row {line}: {message}')
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        rate = self.read / self.elapsed if self.elapsed else 0
+        return (f'{self.read:,} rows in {self.elapsed:.1f}s ({rate:,.0f} rows/s): '
+                f'{self.inserted:,} inserted, {self.updated:,} updated, '
+                f'{self.duplicates:,} duplicates skipped, {self.invalid:,} invalid')
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def validate_car(row, form=None):
+    """Return (values, None) for a valid car row or (None, error message).
+
+    values only has the optional columns (INSERT_DEFAULTS) the row fills
+    in. Pass the same form for every row of an import to skip rebuilding it.
+    """
+    data = MultiDict({name: _text(row.get(name)) for name in CAR_FIELDS})
+    # BooleanField only knows 'false'; a missing value validates as available
+    available = data['is_available'].lower()
+    data['is_available'] = 'y' if not available or available in TRUE_VALUES else ''
+    if form is None:
+        form = CarForm(formdata=data, meta={'csrf': False})
+    else:
+        form.process(data)
+    if not form.validate():
+        return None, '; '.join(f'{field}: {", ".join(errors)}' for field, errors in form.errors.items())
+    values = {name: form[name].data for name in CAR_FIELDS}
+    values['image_url'] = _text(row.get('image_url'))
+    for name in INSERT_DEFAULTS:
+        if not _text(row.get(name)):
+            del values[name]
+    return values, None
+
+
+def import_cars(rows, chunk_size=1000, on_duplicate='skip', echo=None):
+    """Validate and insert car rows in chunks. Returns an ImportReport."""
+    report = ImportReport()
+    form = CarForm(formdata=None, meta={'csrf': False})
+    # Plates earlier in the file; later rows with one are file duplicates,
+    # even when the first row is already committed
+    seen = set()
+    line = 0
+    for chunk in chunked(rows, chunk_size):
+        new = {}
+        for row in chunk:
+            line += 1
+            report.read += 1
+            values, error = validate_car(row, form)
+            if error:
+                report.error(line, error)
+                continue
+            plate = values['license_plate']
+            if plate in seen:
+                report.duplicates += 1
+                continue
+            seen.add(plate)
+            new[plate] = values
+
+        existing = dict(db.session.query(Car.license_plate, Car.id)
+                        .filter(Car.license_plate.in_(list(new))).all()) if new else {}
+        inserts = [dict(INSERT_DEFAULTS, **values) for plate, values in new.items() if plate not in existing]
+        updates = [dict(values, id=existing[plate]) for plate, values in new.items() if plate in existing]
+        if inserts:
+            db.session.execute(db.insert(Car), inserts)
+            report.inserted += len(inserts)
+        if updates and on_duplicate == 'update':
+            now = datetime.utcnow()
+            db.session.execute(db.update(Car), [dict(values, updated_at=now) for values in updates])
+            page_cache.invalidate(*(f'car:{values["id"]}' for values in updates))
+            report.updated += len(updates)
+        else:
+            report.duplicates += len(updates)
+        db.session.commit()
+        if echo:
+            echo(report.summary())
+
+    # Bulk statements skip the ORM events that keep these current
+    car_search.rebuild()
+    page_cache.invalidate('catalog')
+    reports.invalidate_dashboard()
+    return report
+
+
+def _parse_date(value, kind=date):
+    value = _text(value)
+    if not value:
+        return None
+    return kind.fromisoformat(value)
+
+
+def validate_booking(row, cars, users):
+    """Return (values, None) for a valid booking row or (None, error message).
+
+    cars maps license plates to (id, price_per_day); users maps emails to ids.
+    """
+    plate = _text(row.get('license_plate'))
+    email = _text(row.get('customer_email')).lower()
+    if plate not in cars:
+        return None, f'license_plate: no car {plate!r}'
+    if email not in users:
+        return None, f'customer_email: no user {email!r}'
+    try:
+        start_date = _parse_date(row.get('start_date'))
+        end_date = _parse_date(row.get('end_date'))
+        booking_date = _parse_date(row.get('booking_date'), datetime)
+    except ValueError as e:
+        return None, f'dates: {e}'
+    if not start_date or not end_date:
+        return None, 'start_date and end_date are required'
+    if end_date <= start_date:
+        return None, 'end_date: End date must be after start date.'
+    status = _text(row.get('status')).lower() or 'completed'
+    if status not in BOOKING_STATUSES:
+        return None, f'status: must be one of {", ".join(BOOKING_STATUSES)}'
+
+    car_id, price_per_day = cars[plate]
+    total_days = (end_date - start_date).days
+    try:
+        total_price = float(_text(row.get('total_price')) or total_days * price_per_day)
+    except ValueError:
+        return None, 'total_price: not a number'
+    return {
+        'car_id': car_id,
+        'user_id': users[email],
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_days': total_days,
+        'total_price': total_price,
+        'status': status,
+        'booking_date': booking_date or datetime.combine(start_date, datetime.min.time()),
+        'notes': _text(row.get('notes')) or None,
+    }, None
+
+
+def _load_timelines(timelines, car_ids):
+    """Add the active bookings of cars not in timelines yet, in one query."""
+    car_ids = [car_id for car_id in car_ids if car_id not in timelines]
+    if not car_ids:
+        return
+    ranges = {car_id: [] for car_id in car_ids}
+    with use_primary():
+        for car_id, start_date, end_date in db.session.query(
+                Booking.car_id, Booking.start_date, Booking.end_date).filter(
+                Booking.car_id.in_(car_ids), Booking.status.in_(ACTIVE_STATUSES)):
+            ranges[car_id].append((start_date, end_date))
+    for car_id, car_ranges in ranges.items():
+        timelines[car_id] = Timeline(car_ranges)
+
+
+def import_bookings(rows, chunk_size=1000, echo=None):
+    """Insert historical booking rows in chunks. Returns an ImportReport.
+
+    Rows reference their car by license_plate and their customer by
+    customer_email; total_price defaults to days * the car's daily price.
+    Pending and approved rows are rejected when their dates overlap an
+    active booking of the car, in the database or earlier in the file.
+    """
+    report = ImportReport()
+    # Active date ranges per car id, loaded as the cars first come up
+    timelines = {}
+    line = 0
+    for chunk in chunked(rows, chunk_size):
+        plates = {_text(row.get('license_plate')) for row in chunk}
+        emails = {_text(row.get('customer_email')).lower() for row in chunk}
+        cars = {plate: (car_id, price) for plate, car_id, price in db.session.query(
+            Car.license_plate, Car.id, Car.price_per_day).filter(Car.license_plate.in_(plates))}
+        users = dict(db.session.query(db.func.lower(User.email), User.id)
+                     .filter(db.func.lower(User.email).in_(emails)).all())
+
+        _load_timelines(timelines, [car_id for car_id, _ in cars.values()])
+
+        inserts = []
+        claimed = set()
+        for row in chunk:
+            line += 1
+            report.read += 1
+            values, error = validate_booking(row, cars, users)
+            if not error and values['status'] in ACTIVE_STATUSES:
+                timeline = timelines[values['car_id']]
+                if timeline.overlaps(values['start_date'], values['end_date']):
+                    error = 'dates: overlap an active booking of this car'
+                else:
+                    timeline.add(values['start_date'], values['end_date'])
+                    claimed.add(values['car_id'])
+            if error:
+                report.error(line, error)
+            else:
+                inserts.append(values)
+        if inserts:
+            if claimed:
+                # Same booking_version bump as reservations.reserve, so a booking
+                # checked against these cars before this commit is retried
+                db.session.execute(
+                    db.update(Car).where(Car.id.in_(claimed))
+                    .values(booking_version=Car.booking_version + 1, updated_at=Car.updated_at)
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.execute(db.insert(Booking), inserts)
+            report.inserted += len(inserts)
+        db.session.commit()
+        if echo:
+            echo(report.summary())
+
+    reports.rebuild()
+    availability.invalidate()
+    page_cache.invalidate('catalog')
+    return report
+
+
+def init_app(app):
+    app.cli.add_command(fleet_cli)
+
+
+fleet_cli = AppGroup('fleet', help='Bulk fleet and booking history import.')
+
+_format_option = click.option('--format', 'file_format', type=click.Choice(['csv', 'json', 'jsonl']),
+                              help='File format, by default taken from the extension.')
+_chunk_option = click.option('--chunk-size', default=1000, show_default=True,
+                             help='Rows validated and committed together.')
+
+
+def _finish(report):
+    for error in report.errors:
+        click.echo(f'  {error}', err=True)
+    if report.invalid > len(report.errors):
+        click.echo(f'  ... and {report.invalid - len(report.errors)} more invalid rows', err=True)
+    click.echo(report.summary())
+
+
+@fleet_cli.command('import-cars')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@_format_option
+@_chunk_option
+@click.option('--on-duplicate', type=click.Choice(['skip', 'update']), default='skip', show_default=True,
+              help='What to do with a license plate that is already in the database.')
+@click.option('--progress', is_flag=True, help='Print a line after every chunk.')
+def import_cars_command(path, file_format, chunk_size, on_duplicate, progress):
+    """Import cars from a CSV or JSON file."""
+    report = import_cars(read_rows(path, file_format), chunk_size, on_duplicate,
+                         echo=click.echo if progress else None)
+    _finish(report)
+
+
+@fleet_cli.command('import-bookings')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@_format_option
+@_chunk_option
+@click.option('--progress', is_flag=True, help='Print a line after every chunk.')
+def import_bookings_command(path, file_format, chunk_size, progress):
+    """Import historical bookings from a CSV or JSON file."""
+    report = import_bookings(read_rows(path, file_format), chunk_size,
+                             echo=click.echo if progress else None)
+    _finish(report)
@@ -0,0 +1,133 @@
+"""
+User Identity Cache
+Resolves the logged-in user for Flask-Login without a query per request.
+
+load_user() runs on every authenticated request, but views only need to
+know who the user is: their id, name and whether they are an admin. The
+cache keeps a small read-only UserSnapshot of those columns per user id in
+an LRU for USER_CACHE_TTL seconds. Committed changes to a User through the
+ORM drop that user's entry right away; other worker processes see the
+change when their entry expires, so keep the TTL short.
+
+Views that need the full model (relationships, check_password) should load
+it with User.query.get(current_user.id).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User
+from replicas import use_primary
+
+
+class UserSnapshot:
+    """The identity columns of a User, usable as Flask-Login's current_user."""
+
+    __slots__ = ('id', 'email', 'full_name', 'is_admin', 'loaded_at')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, email, full_name, is_admin, loaded_at=None):
+        self.id = id
+        self.email = email
+        self.full_name = full_name
+        self.is_admin = bool(is_admin)
+        self.loaded_at = time.monotonic() if loaded_at is None else loaded_at
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, (UserSnapshot, User)) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.email}>'
+
+
+class UserCache:
+    """LRU of UserSnapshots by user id with a TTL."""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.ttl = 60
+        self.max_size = 10000
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('USER_CACHE_ENABLED', True)
+        self.ttl = app.config.get('USER_CACHE_TTL', 60)
+        self.max_size = app.config.get('USER_CACHE_SIZE', 10000)
+        app.extensions['user_cache'] = self
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def get(self, user_id):
+        """Return the UserSnapshot for user_id, or None if there is no such user."""
+        user_id = int(user_id)
+        if self.enabled:
+            with self._lock:
+                snapshot = self._users.get(user_id)
+                if snapshot is not None and time.monotonic() - snapshot.loaded_at <= self.ttl:
+                    self._users.move_to_end(user_id)
+                    self.hits += 1
+                    return snapshot
+        self.misses += 1
+        # A lagging replica could miss a user who has just registered
+        with use_primary():
+            row = db.session.query(User.id, User.email, User.full_name, User.is_admin)\
+                .filter(User.id == user_id).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        snapshot = UserSnapshot(*row)
+        if self.enabled:
+            with self._lock:
+                self._users[user_id] = snapshot
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_size:
+                    self._users.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id=None):
+        """Drop one user's snapshot, or all of them when user_id is None."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(int(user_id), None)
+
+    def stats(self):
+        return {'size': len(self._users), 'hits': self.hits, 'misses': self.misses}
+
+    # Session event handlers
+
+    def _after_flush(self, session, flush_context):
+        changed = session.info.setdefault('user_cache_changes', set())
+        for obj in session.dirty.union(session.deleted):
+            if isinstance(obj, User):
+                changed.add(obj.id)
+
+    def _after_commit(self, session):
+        for user_id in session.info.pop('user_cache_changes', ()):
+            self.invalidate(user_id)
+
+    def _after_rollback(self, session):
+        session.info.pop('user_cache_changes', None)
+
+
+user_cache = UserCache()
@@ -0,0 +1,262 @@
+"""
+Car Images
+Resolves which static file to show for a car from an in-memory manifest
+of static/img and the upload folder, so rendering a listing does not stat
+the filesystem once per candidate image per car.
+
+Raster images also get resized WebP (and AVIF, when Pillow supports it)
+derivatives in a derived/ subfolder next to the source, generated in a
+process pool after each upload or in bulk with ``flask images backfill``.
+Derivative names carry a content hash of the source:
+    <source stem>.<hash>.<width>w.<format>
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import click
+from flask.cli import AppGroup
+
+try:
+    from PIL import Image
+except ImportError:  # derivatives are skipped without Pillow
+    Image = None
+
+DEFAULT_IMAGE = 'img/default-car.jpg'
+BRAND_IMAGE_EXTENSIONS = ('png', 'jpg', 'svg')
+RASTER_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif', 'webp')
+DERIVED_DIR = 'derived'
+
+
+def slugify(s):
+    return ''.join(c if c.isalnum() else '-' for c in (s or '').strip().lower()).strip('-')
+
+
+def _scan(directory):
+    try:
+        return frozenset(entry.name for entry in os.scandir(directory) if entry.is_file())
+    except FileNotFoundError:
+        return frozenset()
+
+
+def _scan_derived(directory):
+    """Return {source stem: {format: [(width, filename), ...]}} for a derived folder."""
+    derived = {}
+    for name in _scan(os.path.join(directory, DERIVED_DIR)):
+        parts = name.rsplit('.', 3)
+        if len(parts) != 4 or not parts[2].endswith('w') or not parts[2][:-1].isdigit():
+            continue
+        stem, _digest, width, fmt = parts
+        derived.setdefault(stem, {}).setdefault(fmt, []).append((int(width[:-1]), name))
+    for formats in derived.values():
+        for widths in formats.values():
+            widths.sort()
+    return derived
+
+
+def available_formats():
+    """Derivative formats the installed Pillow can write."""
+    if Image is None:
+        return ()
+    extensions = Image.registered_extensions()
+    return tuple(fmt for fmt in ('avif', 'webp') if f'.{fmt}' in extensions)
+
+
+def generate_derivatives(source_path, widths, formats, quality=80):
+    """Write resized copies of source_path into its derived/ folder.
+
+    Runs in a worker process, so it only touches the filesystem and returns
+    the list of file names it wrote. Widths wider than the source are
+    clamped to the source width. Derivatives of an older version of the same
+    source (different content hash) are removed.
+    """
+    with open(source_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:10]
+
+    directory, filename = os.path.split(source_path)
+    stem = filename.rsplit('.', 1)[0]
+    out_dir = os.path.join(directory, DERIVED_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+
+    prefix = f'{stem}.'
+    for name in _scan(out_dir):
+        if name.startswith(prefix) and name.count('.') == stem.count('.') + 3 \
+                and not name.startswith(f'{stem}.{digest}.'):
+            os.remove(os.path.join(out_dir, name))
+
+    written = []
+    with Image.open(source_path) as img:
+        img.load()
+        mode = 'RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        img = img.convert(mode)
+        for width in sorted({min(w, img.width) for w in widths}):
+            height = max(1, round(img.height * width / img.width))
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                name = f'{stem}.{digest}.{width}w.{fmt}'
+                path = os.path.join(out_dir, name)
+                if not os.path.exists(path):
+                    resized.save(path, format=fmt.upper(), quality=quality)
+                    written.append(name)
+    return written
+
+
+class CarImageResolver:
+    """Maps (brand, model, image filename) to a path under static/.
+
+    The manifest is built once at startup and updated by add_upload() when
+    this process saves a file. Uploads saved by other worker processes are
+    picked up by rescanning both folders every ``IMAGE_MANIFEST_TTL``
+    seconds (two directory listings, not one stat per car).
+    """
+
+    def __init__(self, app=None):
+        self.img_dir = None
+        self.uploads_dir = None
+        self.uploads_rel = None
+        self.ttl = None
+        self.widths = ()
+        self.formats = ()
+        self.quality = 80
+        self.pipeline_enabled = False
+        self.max_workers = None
+        self._img = frozenset()
+        self._uploads = frozenset()
+        self._derived = {}
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        self._pool = None
+        self._resolve_cached = lru_cache(maxsize=1024)(self._resolve)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        static_dir = os.path.join(app.root_path, 'static')
+        self.img_dir = os.path.join(static_dir, 'img')
+        self.uploads_dir = app.config['UPLOAD_FOLDER']
+        self.uploads_rel = os.path.relpath(self.uploads_dir, static_dir).replace(os.sep, '/')
+        self.ttl = app.config.get('IMAGE_MANIFEST_TTL')
+        self.widths = tuple(app.config.get('IMAGE_DERIVATIVE_WIDTHS', (320, 640, 1024)))
+        self.formats = available_formats()
+        self.quality = app.config.get('IMAGE_DERIVATIVE_QUALITY', 80)
+        self.pipeline_enabled = app.config.get('IMAGE_PIPELINE_ENABLED', True) and bool(self.formats)
+        self.max_workers = app.config.get('IMAGE_PIPELINE_WORKERS')
+        self._resolve_cached = lru_cache(maxsize=app.config.get('IMAGE_CACHE_SIZE', 1024))(self._resolve)
+        app.extensions['car_images'] = self
+        app.cli.add_command(images_cli)
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the manifest from disk and drop every cached resolution."""
+        with self._lock:
+            self._img = _scan(self.img_dir)
+            self._uploads = _scan(self.uploads_dir)
+            self._derived = {
+                'img': _scan_derived(self.img_dir),
+                self.uploads_rel: _scan_derived(self.uploads_dir),
+            }
+            self._scanned_at = time.monotonic()
+            self._resolve_cached.cache_clear()
+
+    def add_upload(self, filename):
+        """Record a file just saved to the upload folder and queue its derivatives."""
+        with self._lock:
+            self._uploads = self._uploads | {filename}
+            self._resolve_cached.cache_clear()
+        if self.pipeline_enabled and filename.rsplit('.', 1)[-1].lower() in RASTER_EXTENSIONS:
+            future = self._get_pool().submit(
+                generate_derivatives, os.path.join(self.uploads_dir, filename),
+                self.widths, self.formats, self.quality
+            )
+            future.add_done_callback(self._derivatives_done)
+
+    def _derivatives_done(self, future):
+        # Runs on the pool's callback thread; a failed resize just leaves
+        # the original image in use.
+        if future.exception() is None:
+            with self._lock:
+                self._derived[self.uploads_rel] = _scan_derived(self.uploads_dir)
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            atexit.register(self._pool.shutdown, wait=False)
+        return self._pool
+
+    def srcset(self, path, fmt):
+        """Return [(width, static-relative path)] derivatives of a resolved image."""
+        folder, _, filename = path.rpartition('/')
+        stem = filename.rsplit('.', 1)[0]
+        widths = self._derived.get(folder, {}).get(stem, {}).get(fmt, ())
+        return [(width, f'{folder}/{DERIVED_DIR}/{name}') for width, name in widths]
+
+    def sources(self):
+        """Yield absolute paths of every raster image that can have derivatives."""
+        for directory, names in ((self.img_dir, self._img), (self.uploads_dir, self._uploads)):
+            for name in sorted(names):
+                if name.rsplit('.', 1)[-1].lower() in RASTER_EXTENSIONS:
+                    yield os.path.join(directory, name)
+
+    def resolve(self, brand, model, filename):
+        """Return the static-relative path of the best image for a car.
+
+        Priority:
+        1. Uploaded image in the upload folder
+        2. Branded image static/img/<brand>-<model>.<ext> or static/img/<brand>.<ext>
+        3. Default image static/img/default-car.jpg
+        """
+        if self.ttl is not None and time.monotonic() - self._scanned_at > self.ttl:
+            self.refresh()
+        return self._resolve_cached(brand, model, filename)
+
+    def _resolve(self, brand, model, filename):
+        if filename and filename in self._uploads:
+            return f'{self.uploads_rel}/{filename}'
+
+        candidates = []
+        if brand and model:
+            candidates.extend(f'{slugify(brand)}-{slugify(model)}.{ext}' for ext in BRAND_IMAGE_EXTENSIONS)
+        if brand:
+            candidates.extend(f'{slugify(brand)}.{ext}' for ext in BRAND_IMAGE_EXTENSIONS)
+
+        for candidate in candidates:
+            if candidate in self._img:
+                return f'img/{candidate}'
+
+        return DEFAULT_IMAGE
+
+
+car_images = CarImageResolver()
+
+images_cli = AppGroup('images', help='Car image maintenance.')
+
+
+@images_cli.command('backfill')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+def backfill_command(workers):
+    """Generate missing derivatives for every existing car image."""
+    if not car_images.formats:
+        raise click.ClickException('Pillow is not installed or cannot write WebP/AVIF.')
+    sources = list(car_images.sources())
+    started = time.perf_counter()
+    written = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(generate_derivatives, path, car_images.widths,
+                        car_images.formats, car_images.quality): path
+            for path in sources
+        }
+        for future in as_completed(futures):
+            try:
+                written += len(future.result())
+            except Exception as e:
+                failed += 1
+                click.echo(f'Skipped {os.path.basename(futures[future])}: {e}', err=True)
+    car_images.refresh()
+    elapsed = time.perf_counter() - started
+    click.echo(f'Processed {len(sources) - failed} images ({failed} skipped), '
+               f'wrote {written} derivatives in {elapsed:.1f}s')
@@ -1,17 +1,29 @@
 """
 Database Initialization Script
 Run this to create database tables and add sample data
+
+    python init_db.py
+    python init_db.py --cars fleet.csv --bookings history.csv
+
+With --cars the fleet is imported from the file instead of the sample cars
+(see fleet.py for the file layout); --bookings adds booking history.
 """
+import argparse
+
 from app import app, db
 from models import User, Car, Booking
+import migrations
+import fleet
 from datetime import date, timedelta
 
-def init_database():
+def init_database(cars_file=None, bookings_file=None):
     """Initialize database with tables and sample data"""
     with app.app_context():
         # Drop all tables and recreate (for development)
         print("Creating database tables...")
         db.create_all()
+        # Record schema migrations as applied (create_all already built the schema)
+        migrations.upgrade()
         
         # Check if admin already exists
         admin = User.query.filter_by(email='admin@carrental.com').first()
@@ -40,11 +52,16 @@ def init_database():
             db.session.add(customer)
             print("Sample customer created: customer@example.com / password123")
         
+        if cars_file:
+            db.session.commit()
+            report = fleet.import_cars(fleet.read_rows(cars_file))
+            print(f"Imported cars from {cars_file}: {report.summary()}")
+        
         # Add sample cars (Cambodian context)
-        if Car.query.count() == 0:
+        if not cars_file and Car.query.count() == 0:
             sample_cars = [
                 # Sedans
-                Car(
+                dict(
                     brand='Toyota',
                     model='Camry',
                     category='Sedan',
@@ -58,7 +75,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Hyundai',
                     model='Accent',
                     category='Sedan',
@@ -72,7 +89,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Honda',
                     model='Civic',
                     category='Sedan',
@@ -87,7 +104,7 @@ def init_database():
                     is_available=True
                 ),
                 # SUVs
-                Car(
+                dict(
                     brand='Lexus',
                     model='RX300',
                     category='SUV',
@@ -101,7 +118,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Toyota',
                     model='Highlander',
                     category='SUV',
@@ -115,7 +132,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Ford',
                     model='Explorer',
                     category='SUV',
@@ -130,7 +147,7 @@ def init_database():
                     is_available=True
                 ),
                 # Vans
-                Car(
+                dict(
                     brand='Hyundai',
                     model='Starex',
                     category='Van',
@@ -144,7 +161,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Toyota',
                     model='Alphard',
                     category='Van',
@@ -158,7 +175,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Mercedes-Benz',
                     model='V-Class',
                     category='Van',
@@ -173,7 +190,7 @@ def init_database():
                     is_available=True
                 ),
                 # Pickups
-                Car(
+                dict(
                     brand='Ford',
                     model='Ranger',
                     category='Pickup',
@@ -187,7 +204,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Toyota',
                     model='Hilux',
                     category='Pickup',
@@ -201,7 +218,7 @@ def init_database():
                     image_url='default-car.jpg',
                     is_available=True
                 ),
-                Car(
+                dict(
                     brand='Mitsubishi',
                     model='Triton',
                     category='Pickup',
@@ -217,17 +234,25 @@ def init_database():
                 ),
             ]
             
-            for car in sample_cars:
-                db.session.add(car)
+            # One multi-row INSERT instead of a unit-of-work flush per car
+            db.session.execute(db.insert(Car), sample_cars)
             
             print(f"Added {len(sample_cars)} sample cars")
         
         # Commit all changes
         db.session.commit()
+        
+        if bookings_file:
+            report = fleet.import_bookings(fleet.read_rows(bookings_file))
+            print(f"Imported bookings from {bookings_file}: {report.summary()}")
         print("\nDatabase initialized successfully!")
         print("\nYou can now login with:")
         print("Admin - Email: admin@carrental.com, Password: admin123")
         print("Customer - Email: customer@example.com, Password: password123")
 
 if __name__ == '__main__':
-    init_database()
+    parser = argparse.ArgumentParser(description='Create the database tables and add sample data.')
+    parser.add_argument('--cars', help='CSV or JSON fleet file to import instead of the sample cars')
+    parser.add_argument('--bookings', help='CSV or JSON booking history file to import')
+    args = parser.parse_args()
+    init_database(args.cars, args.bookings)
@@ -0,0 +1,256 @@
+"""
+Request Instrumentation
+Opt-in timing of requests, SQL and template rendering.
+
+Enabled with INSTRUMENTATION_ENABLED. When it is off nothing is registered,
+so requests pay no cost at all. When it is on, every response carries a
+Server-Timing header (app, db and tpl durations, visible in the browser's
+network panel) and this worker's totals are served at /metrics in the
+Prometheus text format. Every gunicorn worker keeps its own totals.
+
+/metrics answers only clients in METRICS_ALLOWED_IPS (addresses or
+networks, localhost by default) and requests carrying
+``Authorization: Bearer <METRICS_TOKEN>`` when a token is set; everyone
+else gets a 403.
+
+Statements slower than SLOW_QUERY_MS are logged with their parameters.
+Endpoints listed in PROFILE_ROUTES ('*' for all) are run under cProfile and
+each request writes a .prof file to PROFILE_DIR, to be read with
+``python -m pstats`` or snakeviz.
+"""
+import cProfile
+import hmac
+import ipaddress
+import os
+import tempfile
+import threading
+import time
+
+from flask import Response, abort, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from cache import page_cache
+from dbpool import pool_metrics
+from models import db
+
+# Upper bounds (seconds) of the request duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestStats:
+    """Timings collected for the current request."""
+
+    __slots__ = ('started', 'queries', 'db_time', 'render_time', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+
+
+class Instrumentation:
+    """Collects per-request timings and exposes them as headers and metrics."""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query = None
+        self.profile_routes = frozenset()
+        self.profile_dir = None
+        self.metrics_networks = ()
+        self.metrics_token = None
+        self.logger = None
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._slow_queries = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('INSTRUMENTATION_ENABLED', False)
+        app.extensions['instrumentation'] = self
+        if not self.enabled:
+            return
+
+        slow_ms = app.config.get('SLOW_QUERY_MS')
+        self.slow_query = slow_ms / 1000 if slow_ms else None
+        self.profile_routes = frozenset(app.config.get('PROFILE_ROUTES') or ())
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(
+            tempfile.gettempdir(), 'car_rental_profiles')
+        self.metrics_networks = tuple(ipaddress.ip_network(address, strict=False)
+                                      for address in app.config.get('METRICS_ALLOWED_IPS') or ())
+        self.metrics_token = app.config.get('METRICS_TOKEN') or None
+        self.logger = app.logger
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # Request hooks
+
+    def _before_request(self):
+        g._request_stats = RequestStats()
+        if request.endpoint in self.profile_routes or '*' in self.profile_routes:
+            profiler = g._request_profiler = cProfile.Profile()
+            profiler.enable()
+
+    def _after_request(self, response):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats.started
+        response.headers['Server-Timing'] = ', '.join((
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.render_time * 1000:.1f}',
+        ))
+        self._record(request.endpoint or 'unknown', request.method, response.status_code, elapsed, stats)
+        return response
+
+    def _teardown_request(self, exc):
+        # A teardown also runs when the view raised, unlike after_request; a
+        # profiler left enabled would profile every later request of the thread
+        profiler = g.pop('_request_profiler', None)
+        if profiler is None:
+            return
+        profiler.disable()
+        try:
+            self._dump_profile(profiler)
+        except OSError:
+            self.logger.exception('Could not write the profile of %s', request.endpoint)
+
+    def _dump_profile(self, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f'{request.endpoint}.{time.strftime("%Y%m%d-%H%M%S")}.{os.getpid()}.{time.perf_counter_ns()}.prof'
+        profiler.dump_stats(os.path.join(self.profile_dir, name))
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = g.get('_request_stats')
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = g.get('_request_stats')
+        if stats is not None and stats.render_started is not None:
+            stats.render_time += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    # Engine events
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        if has_request_context():
+            stats = g.get('_request_stats')
+            if stats is not None:
+                stats.queries += 1
+                stats.db_time += elapsed
+        if self.slow_query is not None and elapsed >= self.slow_query:
+            with self._lock:
+                self._slow_queries += 1
+            self.logger.warning('Slow query (%.1f ms): %s | parameters: %r',
+                                elapsed * 1000, statement, parameters)
+
+    # Metrics
+
+    def _record(self, endpoint, method, status, elapsed, stats):
+        key = (endpoint, method, status)
+        with self._lock:
+            totals = self._requests.get(key)
+            if totals is None:
+                totals = self._requests[key] = {
+                    'count': 0, 'seconds': 0.0, 'queries': 0, 'db_seconds': 0.0,
+                    'render_seconds': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+                }
+            totals['count'] += 1
+            totals['seconds'] += elapsed
+            totals['queries'] += stats.queries
+            totals['db_seconds'] += stats.db_time
+            totals['render_seconds'] += stats.render_time
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    totals['buckets'][i] += 1
+
+    def render_metrics(self, extra=None):
+        """This worker's totals in the Prometheus text exposition format."""
+        with self._lock:
+            requests = {key: dict(totals, buckets=list(totals['buckets']))
+                        for key, totals in self._requests.items()}
+            slow_queries = self._slow_queries
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('http_request_duration_seconds', 'histogram', 'Request wall time.')
+        for (endpoint, method, status), totals in sorted(requests.items()):
+            labels = f'endpoint="{endpoint}",method="{method}",status="{status}"'
+            for bound, count in zip(DURATION_BUCKETS, totals['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {totals["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {totals["seconds"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {totals["count"]}')
+
+        for name, field, help_text in (
+            ('db_queries_total', 'queries', 'SQL statements executed by requests.'),
+            ('db_query_seconds_total', 'db_seconds', 'Time spent in SQL statements.'),
+            ('template_render_seconds_total', 'render_seconds', 'Time spent rendering templates.'),
+        ):
+            family(name, 'counter', help_text)
+            by_endpoint = {}
+            for (endpoint, _, _), totals in requests.items():
+                by_endpoint[endpoint] = by_endpoint.get(endpoint, 0) + totals[field]
+            for endpoint, value in sorted(by_endpoint.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {value:g}')
+
+        family('db_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_MS.')
+        lines.append(f'db_slow_queries_total {slow_queries}')
+
+        for name, (kind, help_text, value) in sorted((extra or {}).items()):
+            family(name, kind, help_text)
+            lines.append(f'{name} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def _metrics_allowed(self):
+        if self.metrics_token:
+            scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+            if scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), self.metrics_token.encode()):
+                return True
+        try:
+            address = ipaddress.ip_address(request.remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.metrics_networks)
+
+    def metrics_view(self):
+        if not self._metrics_allowed():
+            abort(403)
+        pool = pool_metrics.snapshot(db.engine)
+        cache = page_cache.stats()
+        extra = {
+            'db_pool_checkouts_total': ('counter', 'Connection pool checkouts.', pool['checkouts']),
+            'db_pool_timeouts_total': ('counter', 'Connection pool checkout timeouts.', pool['timeouts']),
+            'db_pool_wait_p99_seconds': ('gauge', 'p99 checkout time of recent checkouts.',
+                                         pool['wait_p99_ms'] / 1000),
+            'page_cache_hits_total': ('counter', 'Page cache hits.', cache['hits']),
+            'page_cache_misses_total': ('counter', 'Page cache misses.', cache['misses']),
+        }
+        if 'checked_out' in pool:
+            extra['db_pool_checked_out'] = ('gauge', 'Connections currently checked out.', pool['checked_out'])
+        return Response(self.render_metrics(extra), mimetype='text/plain; version=0.0.4')
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,198 @@
+"""
+Booking Lifecycle
+Moves bookings along as their dates pass and keeps Car.is_available in step.
+
+    flask lifecycle run                  one pass
+    flask lifecycle run --every 300      keep running as a daemon
+
+or set LIFECYCLE_INTERVAL to run a pass every that many seconds in a
+background thread of each web worker. Each pass:
+
+    expires   pending bookings whose start date has passed unapproved
+    completes approved bookings whose end date has passed, and makes their
+              car available again unless it has another approved booking
+              ahead (the same as cancelling an approved booking does)
+    holds     cars marked available during an approved rental
+
+Transitions are set-based UPDATEs over chunks of LIFECYCLE_BATCH_SIZE
+bookings, committed per chunk together with the matching report rollup
+changes and car releases. A pass only touches rows that are due, so
+running it again, or from several workers at once, changes nothing more.
+"""
+import threading
+import time
+from datetime import date, datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import exists
+
+from models import db, Car, Booking
+from availability import availability
+from cache import page_cache
+import reports
+
+
+class LifecycleReport:
+    """Rows changed by one pass."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.expired = 0
+        self.completed = 0
+        self.released = 0
+        self.held = 0
+
+    @property
+    def changed(self):
+        return self.expired + self.completed + self.released + self.held
+
+    def summary(self):
+        return (f'{self.expired:,} bookings expired, {self.completed:,} completed, '
+                f'{self.released:,} cars made available, {self.held:,} cars marked unavailable '
+                f'in {self.elapsed:.2f}s')
+
+
+def _upcoming_approved(today):
+    """Cars with an approved booking that has not ended yet."""
+    return exists().where(Booking.car_id == Car.id, Booking.status == 'approved', Booking.end_date >= today)
+
+
+def _transition(old_status, new_status, due, today, batch_size, release_cars=False):
+    """Move due bookings from old_status to new_status. Returns (bookings, cars released, car ids)."""
+    moved = released = 0
+    car_ids = set()
+    while True:
+        rows = db.session.query(Booking.id, Booking.car_id, Booking.booking_date, Booking.total_price)\
+            .filter(Booking.status == old_status, due).order_by(Booking.id)\
+            .limit(batch_size).with_for_update().all()
+        if not rows:
+            return moved, released, car_ids
+        ids = [row.id for row in rows]
+        updated = db.session.execute(
+            db.update(Booking).where(Booking.id.in_(ids), Booking.status == old_status)
+            .values(status=new_status).execution_options(synchronize_session=False)
+        ).rowcount
+        if updated != len(ids):
+            # A booking changed under us; its rollup delta would be wrong, so redo the chunk
+            db.session.rollback()
+            continue
+
+        deltas = []
+        for row in rows:
+            day = row.booking_date.date() if row.booking_date else today
+            deltas.append((day, row.car_id, old_status, -1, -(row.total_price or 0)))
+            deltas.append((day, row.car_id, new_status, 1, row.total_price or 0))
+        reports.apply_deltas(db.session.connection(), deltas)
+
+        chunk_cars = {row.car_id for row in rows}
+        if release_cars:
+            released_ids = [car_id for (car_id,) in db.session.query(Car.id).filter(
+                Car.id.in_(chunk_cars), Car.is_available == False, ~_upcoming_approved(today))]
+            if released_ids:
+                released += db.session.execute(
+                    db.update(Car).where(Car.id.in_(released_ids), Car.is_available == False)
+                    .values(is_available=True, updated_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                page_cache.invalidate(*(f'car:{car_id}' for car_id in released_ids))
+        db.session.commit()
+        moved += updated
+        car_ids |= chunk_cars
+
+
+def run(batch_size=None, today=None):
+    """Apply every due transition. Returns a LifecycleReport."""
+    batch_size = batch_size or current_app.config.get('LIFECYCLE_BATCH_SIZE', 1000)
+    today = today or date.today()
+    report = LifecycleReport()
+
+    report.expired, _, expired_cars = _transition(
+        'pending', 'expired', Booking.start_date < today, today, batch_size)
+    report.completed, report.released, completed_cars = _transition(
+        'approved', 'completed', Booking.end_date < today, today, batch_size, release_cars=True)
+
+    renting = exists().where(Booking.car_id == Car.id, Booking.status == 'approved',
+                             Booking.start_date <= today, Booking.end_date >= today)
+    held_ids = [car_id for (car_id,) in db.session.query(Car.id).filter(Car.is_available == True, renting)]
+    if held_ids:
+        report.held = db.session.execute(
+            db.update(Car).where(Car.id.in_(held_ids), Car.is_available == True)
+            .values(is_available=False, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        page_cache.invalidate(*(f'car:{car_id}' for car_id in held_ids))
+
+    # Bulk UPDATEs skip the session events that keep these current
+    for car_id in expired_cars | completed_cars:
+        availability.invalidate(car_id)
+    if report.changed:
+        page_cache.invalidate('catalog')
+        reports.invalidate_dashboard()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+class LifecycleScheduler:
+    """Runs a pass every LIFECYCLE_INTERVAL seconds in a daemon thread.
+
+    The thread starts with the first request, so CLI commands and scripts
+    that import the app never start one.
+    """
+
+    def __init__(self, app=None):
+        self.interval = 0
+        self.last_report = None
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.interval = app.config.get('LIFECYCLE_INTERVAL', 0)
+        app.extensions['lifecycle'] = self
+        app.cli.add_command(lifecycle_cli)
+        if self.interval:
+            app.before_request(self._ensure_started)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, args=(current_app._get_current_object(),),
+                                                name='booking-lifecycle', daemon=True)
+                self._thread.start()
+
+    def _loop(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.last_report = run()
+                    if self.last_report.changed:
+                        app.logger.info('Booking lifecycle: %s', self.last_report.summary())
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Booking lifecycle pass failed')
+            time.sleep(self.interval)
+
+
+lifecycle = LifecycleScheduler()
+
+lifecycle_cli = AppGroup('lifecycle', help='Booking status transitions.')
+
+
+@lifecycle_cli.command('run')
+@click.option('--every', type=float, metavar='SECONDS', help='Keep running, one pass every SECONDS.')
+@click.option('--batch-size', type=int, help='Bookings updated per transaction.')
+def run_command(every, batch_size):
+    """Expire, complete and release what is due."""
+    while True:
+        click.echo(run(batch_size).summary())
+        if not every:
+            return
+        db.session.remove()
+        time.sleep(every)
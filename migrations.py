@@ -0,0 +1,137 @@
+"""
+Schema Migrations
+Ordered schema changes for databases created before a table or index was
+added to models.py. ``db.create_all()`` only creates missing tables, so an
+existing database picks up new indexes and tables here:
+
+    flask schema upgrade     apply pending migrations
+    flask schema status      list applied and pending migrations
+
+Applied migration ids are recorded in the schema_migrations table. Every
+step checks what already exists, so running upgrade on a fresh database
+built by init_db.py just records the ids.
+"""
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect
+
+from models import db, User, Car, Booking, BookingDailyStat, BookingCarStat
+import reports
+
+# Kept out of db.metadata so create_all() does not mark migrations as applied
+_meta = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _meta,
+    Column('id', String(100), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _create_tables(*models):
+    def step(connection):
+        for model in models:
+            model.__table__.create(bind=connection, checkfirst=True)
+    return step
+
+
+def _create_report_rollups(connection):
+    _create_tables(BookingDailyStat, BookingCarStat)(connection)
+    reports.rebuild(connection)
+
+
+def _create_indexes(*names):
+    def step(connection):
+        existing = {}
+        for model in (User, Car, Booking):
+            table = model.__table__
+            for index in table.indexes:
+                if index.name not in names:
+                    continue
+                if index.dialect_options['mysql'].get('prefix') == 'FULLTEXT' \
+                        and connection.dialect.name != 'mysql':
+                    continue
+                if table.name not in existing:
+                    existing[table.name] = {ix['name'] for ix in inspect(connection).get_indexes(table.name)}
+                if index.name not in existing[table.name]:
+                    index.create(bind=connection)
+    return step
+
+
+def _add_columns(model, *names):
+    def step(connection):
+        table = model.__table__
+        existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+        for name in names:
+            if name in existing:
+                continue
+            column = table.c[name]
+            ddl = f'{column.type.compile(connection.dialect)} NOT NULL' if not column.nullable \
+                else column.type.compile(connection.dialect)
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {name} {ddl}')
+    return step
+
+
+MIGRATIONS = [
+    ('0001_report_rollups', _create_report_rollups),
+    ('0002_hot_path_indexes', _create_indexes(
+        'ix_bookings_conflict',
+        'ix_bookings_user_history',
+        'ix_bookings_status_date',
+        'ix_bookings_booking_date',
+        'ix_cars_available_category_price',
+        'ix_cars_created_at',
+        'ix_users_admin_created',
+    )),
+    ('0003_cars_fulltext', _create_indexes('ft_cars_search')),
+    ('0004_cars_booking_version', _add_columns(Car, 'booking_version')),
+]
+
+
+def applied():
+    """Return the set of migration ids already applied."""
+    with db.engine.begin() as connection:
+        schema_migrations.create(bind=connection, checkfirst=True)
+        return {row[0] for row in connection.execute(schema_migrations.select())}
+
+
+def upgrade():
+    """Apply pending migrations in order. Returns the ids applied."""
+    done = applied()
+    ran = []
+    for migration_id, step in MIGRATIONS:
+        if migration_id in done:
+            continue
+        with db.engine.begin() as connection:
+            step(connection)
+            connection.execute(schema_migrations.insert().values(
+                id=migration_id, applied_at=datetime.utcnow()))
+        ran.append(migration_id)
+    return ran
+
+
+def init_app(app):
+    app.cli.add_command(schema_cli)
+
+
+schema_cli = AppGroup('schema', help='Database schema migrations.')
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending schema migrations."""
+    ran = upgrade()
+    for migration_id in ran:
+        click.echo(f'Applied {migration_id}')
+    click.echo(f'{len(ran)} migration(s) applied.' if ran else 'Schema is up to date.')
+
+
+@schema_cli.command('status')
+def status_command():
+    """List applied and pending schema migrations."""
+    done = applied()
+    for migration_id, _ in MIGRATIONS:
+        click.echo(f"{'applied' if migration_id in done else 'pending'}  {migration_id}")
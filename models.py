@@ -2,11 +2,16 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # admin_customers: non-admin users newest first
+        db.Index('ix_users_admin_created', 'is_admin', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
@@ -31,6 +36,14 @@ class User(UserMixin, db.Model):
 
 class Car(db.Model):
     __tablename__ = 'cars'
+    __table_args__ = (
+        # /cars filters: availability flag, then category and price range
+        db.Index('ix_cars_available_category_price', 'is_available', 'category', 'price_per_day'),
+        # index and admin_cars: newest cars first
+        db.Index('ix_cars_created_at', 'created_at'),
+        # Used by search.py for MATCH ... AGAINST; other databases use the in-memory index
+        db.Index('ft_cars_search', 'brand', 'model', 'description', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     brand = db.Column(db.String(50), nullable=False)
@@ -47,6 +60,8 @@ class Car(db.Model):
     is_available = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every new booking of the car; see reservations.py
+    booking_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     bookings = db.relationship('Booking', backref='car', lazy='dynamic', cascade='all, delete-orphan')
@@ -57,6 +72,16 @@ class Car(db.Model):
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        # Conflict checks and the availability anti-join (also serves car_id lookups)
+        db.Index('ix_bookings_conflict', 'car_id', 'status', 'start_date', 'end_date'),
+        # my_bookings: one user's history, newest first
+        db.Index('ix_bookings_user_history', 'user_id', 'booking_date'),
+        # admin_bookings filtered by status, newest first
+        db.Index('ix_bookings_status_date', 'status', 'booking_date'),
+        # admin_bookings unfiltered, dashboard recent bookings
+        db.Index('ix_bookings_booking_date', 'booking_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -65,7 +90,7 @@ class Booking(db.Model):
     end_date = db.Column(db.Date, nullable=False)
     total_days = db.Column(db.Integer, nullable=False)
     total_price = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, approved, cancelled, completed
+    status = db.Column(db.String(20), default='pending')  # pending, approved, cancelled, completed, expired
     booking_date = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text)
     
@@ -77,3 +102,30 @@ class Booking(db.Model):
         if self.car:
             return self.total_days * self.car.price_per_day
         return 0
+
+
+class BookingDailyStat(db.Model):
+    """Bookings made per day, car and status (maintained by reports.py)"""
+    __tablename__ = 'booking_daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    car_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<BookingDailyStat {self.day} car={self.car_id} {self.status}>'
+
+
+class BookingCarStat(db.Model):
+    """All-time bookings per car and status (maintained by reports.py)"""
+    __tablename__ = 'booking_car_stats'
+    
+    car_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<BookingCarStat car={self.car_id} {self.status}>'
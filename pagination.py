@@ -0,0 +1,166 @@
+"""
+Keyset Pagination
+Cursor-based paging for the listing pages.
+
+Instead of OFFSET, each page seeks past the last row of the previous one
+on an indexed (timestamp, id) key, so page 500 costs the same as page 1.
+Previous/next links carry an opaque cursor token; numbered page links keep
+working through an OFFSET fallback. The total behind ``pages`` and
+``iter_pages`` comes from a COUNT that is cached for a short time instead
+of being re-run on every page.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from flask import current_app, request
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import and_, or_
+
+from cache import MemoryBackend
+
+_count_cache = MemoryBackend(max_entries=256)
+
+
+def encode_cursor(page, direction, values):
+    payload = [page, direction, [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Return (page, direction, values) from a cursor token, or None if invalid."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        page, direction, values = json.loads(raw)
+        if direction not in ('next', 'prev') or len(values) != len(columns) or int(page) < 1:
+            return None
+        parsed = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if python_type in (date, datetime):
+                value = python_type.fromisoformat(value)
+            parsed.append(value)
+        return int(page), direction, parsed
+    except (binascii.Error, ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def _seek(columns, values, direction):
+    """WHERE clause for rows after (next) or before (prev) the key values.
+
+    Expanded from a row comparison into OR/AND terms so every database can
+    use the (timestamp, id) index for it.
+    """
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        beyond = column < values[i] if direction == 'next' else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_query(query, columns, values=None, direction='next'):
+    """query as a keyset page runs it: past values in direction, nearest rows first.
+
+    Without values this is the first page, newest first.
+    """
+    if values is None:
+        return query.order_by(*(c.desc() for c in columns))
+    query = query.filter(_seek(columns, values, direction))
+    return query.order_by(*(c.desc() if direction == 'next' else c.asc() for c in columns))
+
+
+class KeysetPagination(Pagination):
+    """Pagination over a query ordered by ``columns`` descending.
+
+    Exposes the usual Flask-SQLAlchemy attributes (items, page, pages,
+    iter_pages, has_next, ...) plus ``next_cursor`` and ``prev_cursor``.
+    """
+
+    def _query_items(self):
+        args = self._query_args
+        query, columns, key = args['query'], args['columns'], args['key']
+        cursor = decode_cursor(args['cursor'], columns) if args.get('cursor') else None
+        self._more = False
+
+        if cursor is None:
+            rows = keyset_query(query, columns).limit(self.per_page + 1).offset(self._query_offset).all()
+            self._more = len(rows) > self.per_page
+            items = rows[:self.per_page]
+            self._before = self.page > 1
+        else:
+            self.page, direction, values = cursor
+            seek = keyset_query(query, columns, values, direction)
+            if direction == 'next':
+                rows = seek.limit(self.per_page + 1).all()
+                self._more = len(rows) > self.per_page
+                items = rows[:self.per_page]
+                self._before = True
+            else:
+                rows = seek.limit(self.per_page + 1).all()
+                items = list(reversed(rows[:self.per_page]))
+                self._more = True
+                self._before = len(rows) > self.per_page and self.page > 1
+
+        self._first_key = key(items[0]) if items else None
+        self._last_key = key(items[-1]) if items else None
+        return items
+
+    def _query_count(self):
+        query = self._query_args['query']
+        statement = query.statement
+        cache_key = f'{statement}|{sorted(statement.compile().params.items())!r}'
+        total = _count_cache.get(cache_key)
+        if total is None:
+            total = query.order_by(None).count()
+            _count_cache.set(cache_key, total, current_app.config.get('PAGINATION_COUNT_TTL', 60))
+        # A cached total can lag behind; never report fewer pages than we can see
+        seen = (self.page - 1) * self.per_page + len(self.items) + (1 if self._more else 0)
+        return max(total, seen)
+
+    @property
+    def has_next(self):
+        return self._more
+
+    @property
+    def has_prev(self):
+        return self._before
+
+    @property
+    def next_cursor(self):
+        if not self._more or self._last_key is None:
+            return None
+        return encode_cursor(self.page + 1, 'next', self._last_key)
+
+    @property
+    def prev_cursor(self):
+        if not self._before or self._first_key is None:
+            return None
+        if self.page <= 2:
+            return None  # plain page=1 link
+        return encode_cursor(self.page - 1, 'prev', self._first_key)
+
+
+def page_link_args(pagination, direction):
+    """url_for() arguments for a Previous/Next link: a cursor when one exists,
+    otherwise the page number (also works for offset Pagination objects)."""
+    cursor = getattr(pagination, f'{direction}_cursor', None)
+    if cursor:
+        return {'cursor': cursor}
+    return {'page': pagination.prev_num if direction == 'prev' else pagination.next_num}
+
+
+def paginate(query, columns, key, per_page):
+    """Paginate query newest-first on columns, honouring PAGINATION_MODE.
+
+    ``key(item)`` must return the values of ``columns`` for a result row.
+    In 'offset' mode this is the stock Flask-SQLAlchemy paginate().
+    """
+    if current_app.config.get('PAGINATION_MODE', 'keyset') != 'keyset':
+        return keyset_query(query, columns).paginate(per_page=per_page, error_out=False)
+    return KeysetPagination(
+        per_page=per_page, max_per_page=None, error_out=False,
+        query=query, columns=columns, key=key, cursor=request.args.get('cursor')
+    )
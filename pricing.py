@@ -0,0 +1,182 @@
+"""
+Pricing Engine
+Rental totals from the car's daily price and the PRICING_RULES tables:
+
+    seasons     date ranges (both ends included) with a multiplier; when
+                ranges overlap, the one listed last wins
+    weekdays    multiplier per day of the week, e.g. {'sat': 1.15, 'sun': 1.15}
+    durations   (minimum days, multiplier) tiers applied to the whole rental,
+                e.g. [(7, 0.9), (30, 0.8)]
+    categories  per-category tables that replace the ones above, e.g.
+                {'SUV': {'weekdays': {'fri': 1.1, 'sat': 1.2, 'sun': 1.2}}}
+
+A rental from start_date to end_date is charged for the days start_date up
+to the day before end_date, the same total_days as before:
+
+    total = round(price_per_day * sum(season(d) * weekday(d)) * duration(total_days))
+
+With no rules this is total_days * price_per_day. For every category the
+engine precomputes the daily multipliers over a rolling horizon and their
+prefix sums, so the sum over any date range is one subtraction. Quoting a
+page of cars for a set of date ranges evaluates each (category, range)
+once and scales the whole price vector, with NumPy when it is installed.
+"""
+import threading
+from bisect import bisect_right
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # quote_many falls back to plain lists
+    np = None
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+# Days from today covered by the precomputed tables; later dates are summed day by day
+HORIZON_DAYS = 730
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+class RateTable:
+    """The season, weekday and duration rules in effect for one category."""
+
+    def __init__(self, seasons=(), weekdays=None, durations=()):
+        self.seasons = [(_as_date(rule['start']), _as_date(rule['end']), float(rule['multiplier']))
+                        for rule in seasons]
+        self.weekdays = [1.0] * 7
+        for name, multiplier in (weekdays or {}).items():
+            self.weekdays[WEEKDAYS.index(name.lower()[:3])] = float(multiplier)
+        tiers = sorted((int(min_days), float(multiplier)) for min_days, multiplier in durations)
+        self.tier_days = [min_days for min_days, _ in tiers]
+        self.tier_multipliers = [multiplier for _, multiplier in tiers]
+
+    def day_multiplier(self, day):
+        multiplier = self.weekdays[day.weekday()]
+        for start, end, season in reversed(self.seasons):
+            if start <= day <= end:
+                return multiplier * season
+        return multiplier
+
+    def duration_multiplier(self, days):
+        i = bisect_right(self.tier_days, days) - 1
+        return self.tier_multipliers[i] if i >= 0 else 1.0
+
+    def daily_multipliers(self, origin, days):
+        """Multiplier of each day from origin on, seasons applied in one pass each."""
+        values = [self.weekdays[(origin + timedelta(days=i)).weekday()] for i in range(days)]
+        seasonal = [1.0] * days
+        for start, end, season in self.seasons:
+            first = max((start - origin).days, 0)
+            last = min((end - origin).days, days - 1)
+            for i in range(first, last + 1):
+                seasonal[i] = season
+        return [value * season for value, season in zip(values, seasonal)]
+
+
+class PricingEngine:
+    """Quotes rentals from prefix sums of each category's daily multipliers."""
+
+    def __init__(self, rules=None, origin=None, horizon=HORIZON_DAYS):
+        rules = rules or {}
+        self.origin = origin or date.today()
+        self.horizon = horizon
+        base = {name: rules.get(name) for name in ('seasons', 'weekdays', 'durations')}
+        self.default = RateTable(base['seasons'] or (), base['weekdays'], base['durations'] or ())
+        self.tables = {}
+        for category, overrides in (rules.get('categories') or {}).items():
+            merged = dict(base, **overrides)
+            self.tables[category] = RateTable(merged['seasons'] or (), merged['weekdays'],
+                                              merged['durations'] or ())
+        self._prefix = {}
+        for key, table in [(None, self.default)] + list(self.tables.items()):
+            running = [0.0]
+            for value in table.daily_multipliers(self.origin, horizon):
+                running.append(running[-1] + value)
+            self._prefix[key] = running
+
+    def _key(self, category):
+        return category if category in self.tables else None
+
+    def range_factor(self, category, start_date, end_date):
+        """Sum of season * weekday multipliers over the charged days, times the duration tier."""
+        key = self._key(category)
+        table = self.tables.get(key, self.default)
+        days = (end_date - start_date).days
+        if days <= 0:
+            return 0.0
+        first = (start_date - self.origin).days
+        last = first + days
+        if 0 <= first and last <= self.horizon:
+            prefix = self._prefix[key]
+            total = prefix[last] - prefix[first]
+        else:
+            total = sum(table.day_multiplier(start_date + timedelta(days=i)) for i in range(days))
+        return total * table.duration_multiplier(days)
+
+    def quote(self, price_per_day, category, start_date, end_date):
+        """Total price of one rental, in whole Riel."""
+        return float(round(price_per_day * self.range_factor(category, start_date, end_date)))
+
+    def quote_many(self, cars, ranges):
+        """Totals for every car and date range: result[i][j] is cars[i] over ranges[j].
+
+        cars are (price_per_day, category) pairs and ranges (start_date,
+        end_date) pairs. Returns a NumPy array when NumPy is installed,
+        otherwise a list of lists.
+        """
+        cars = list(cars)
+        ranges = list(ranges)
+        keys = sorted({self._key(category) for _, category in cars}, key=lambda key: (key is not None, key))
+        factors = {key: [self.range_factor(key, start, end) for start, end in ranges] for key in keys}
+        if np is not None:
+            if not cars or not ranges:
+                return np.zeros((len(cars), len(ranges)))
+            row_of = {key: i for i, key in enumerate(keys)}
+            table = np.array([factors[key] for key in keys], dtype=float)
+            prices = np.array([price for price, _ in cars], dtype=float)
+            rows = np.array([row_of[self._key(category)] for _, category in cars])
+            return np.rint(prices[:, None] * table[rows])
+        return [[float(round(price * factor)) for factor in factors[self._key(category)]]
+                for price, category in cars]
+
+
+class Pricing:
+    """Holds the engine for PRICING_RULES, rebuilt when the day rolls over."""
+
+    def __init__(self, app=None):
+        self.rules = {}
+        self._engine = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rules = app.config.get('PRICING_RULES') or {}
+        # Build once now so a malformed rule fails at startup, not on a booking
+        self._engine = PricingEngine(self.rules)
+        app.extensions['pricing'] = self
+
+    @property
+    def engine(self):
+        engine = self._engine
+        if engine is None or engine.origin != date.today():
+            with self._lock:
+                engine = self._engine
+                if engine is None or engine.origin != date.today():
+                    engine = self._engine = PricingEngine(self.rules)
+        return engine
+
+    def quote(self, price_per_day, category, start_date, end_date):
+        return self.engine.quote(price_per_day, category, start_date, end_date)
+
+    def quote_cars(self, cars, start_date, end_date):
+        """{car.id: total} for Car rows over one date range, in a single pass."""
+        cars = list(cars)
+        totals = self.engine.quote_many([(car.price_per_day, car.category) for car in cars],
+                                        [(start_date, end_date)])
+        return {car.id: float(totals[i][0]) for i, car in enumerate(cars)}
+
+
+pricing = Pricing()
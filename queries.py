@@ -0,0 +1,45 @@
+"""
+Query Builders
+Listing queries that eager-load what their templates render, so a page
+costs a fixed number of queries instead of one extra query per row.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+
+from models import db, User, Car, Booking
+
+# Keyset pagination columns of the listing pages, newest first
+BOOKING_KEY = (Booking.booking_date, Booking.id)
+CAR_KEY = (Car.created_at, Car.id)
+CUSTOMER_KEY = (User.created_at, User.id)
+
+
+def bookings_with_details():
+    """Booking query with the customer and car joined into the same SELECT."""
+    return Booking.query.options(
+        joinedload(Booking.customer),
+        joinedload(Booking.car)
+    )
+
+
+def bookings_with_car():
+    """Booking query with only the car joined (for a customer's own history)."""
+    return Booking.query.options(joinedload(Booking.car))
+
+
+def customers_with_booking_counts():
+    """Query of (User, booking_count) rows for non-admin users.
+
+    Booking counts come from one grouped subquery outer-joined to users
+    rather than a COUNT per customer from the dynamic relationship.
+    """
+    booking_counts = db.session.query(
+        Booking.user_id.label('user_id'),
+        func.count(Booking.id).label('booking_count')
+    ).group_by(Booking.user_id).subquery()
+
+    return db.session.query(
+        User,
+        func.coalesce(booking_counts.c.booking_count, 0).label('booking_count')
+    ).outerjoin(booking_counts, booking_counts.c.user_id == User.id)\
+     .filter(User.is_admin == False)
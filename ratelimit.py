@@ -0,0 +1,221 @@
+"""
+Rate Limiting
+Token-bucket limits for the expensive and abusable form posts.
+
+Each rule in RATELIMITS, such as ``'login:email': '5/minute'``, is a bucket
+that holds up to 5 tokens and refills at 5 per minute. Every POST to a
+limited view takes one token from each bucket that applies (per client IP,
+per submitted email, per logged-in user). When any bucket is empty the view
+is not run at all, so a credential-stuffing burst never reaches the
+password hashing, and the client gets a 429 with Retry-After.
+
+Responses of limited views carry X-RateLimit-Limit, X-RateLimit-Remaining
+and X-RateLimit-Reset (seconds until the bucket is full again) for the
+bucket closest to running out.
+
+Stores: 'memory' keeps buckets per worker process. 'sqlite' keeps them in
+a SQLite file shared by every worker on the host. Behind a reverse proxy,
+wrap the app in werkzeug's ProxyFix so the client IP is the real one.
+"""
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import abort, current_app, g, render_template, request
+from flask_login import current_user
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'5/minute' -> (capacity 5, refill rate in tokens per second)."""
+    count, _, period = rate.partition('/')
+    seconds = PERIODS[period.strip().rstrip('s')]
+    count = int(count)
+    return count, count / seconds
+
+
+def refill(tokens, updated_at, capacity, rate, now):
+    if tokens is None:
+        return float(capacity)
+    return min(float(capacity), tokens + (now - updated_at) * rate)
+
+
+class MemoryStore:
+    """Buckets in a dict, least recently used ones dropped past max_keys."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, cost=1):
+        """Take cost tokens if available. Returns (allowed, tokens left)."""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (None, now))
+            tokens = refill(tokens, updated_at, capacity, rate, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file, updated atomically across processes."""
+
+    # Buckets untouched for this long are full again and can be deleted
+    PRUNE_AFTER = 86400
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, rate, cost=1):
+        now = time.time()
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = refill(row[0] if row else None, row[1] if row else now, capacity, rate, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            connection.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                               (key, tokens, now))
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                connection.execute('DELETE FROM buckets WHERE updated_at < ?', (now - self.PRUNE_AFTER,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed, tokens
+
+    def clear(self):
+        self._connect().execute('DELETE FROM buckets')
+
+
+def make_store(app):
+    name = app.config.get('RATELIMIT_STORE', 'memory')
+    if name == 'memory':
+        return MemoryStore()
+    if name == 'sqlite':
+        path = app.config.get('RATELIMIT_SQLITE_PATH') or os.path.join(
+            tempfile.gettempdir(), 'car_rental_ratelimit.db')
+        return SQLiteStore(path)
+    raise ValueError(f'Unknown RATELIMIT_STORE: {name!r}')
+
+
+def _client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def _form_email():
+    return (request.form.get('email') or '').strip().lower() or None
+
+
+def _user_id():
+    return current_user.get_id() if current_user.is_authenticated else None
+
+
+KEY_FUNCTIONS = {'ip': _client_ip, 'email': _form_email, 'user': _user_id}
+
+
+class RateLimiter:
+    """Applies the RATELIMITS rules to decorated views."""
+
+    def __init__(self, app=None):
+        self.store = MemoryStore()
+        self.rules = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.store = make_store(app)
+        self.rules = {name: parse_rate(rate) for name, rate in (app.config.get('RATELIMITS') or {}).items()}
+        app.extensions['limiter'] = self
+        app.after_request(self._add_headers)
+        app.register_error_handler(429, self._too_many_requests)
+
+    def limit(self, scope, *kinds):
+        """Limit POSTs to a view per 'ip', 'email' and/or 'user'.
+
+        The rule for each kind is RATELIMITS['<scope>:<kind>']; kinds
+        without a rule, or without a value for this request, are skipped.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method == 'POST' and current_app.config.get('RATELIMIT_ENABLED', True):
+                    self.check(scope, kinds)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def check(self, scope, kinds):
+        """Take a token from every bucket; abort with 429 if any is empty."""
+        tightest = None
+        blocked = None
+        for kind in kinds:
+            rule = self.rules.get(f'{scope}:{kind}')
+            value = KEY_FUNCTIONS[kind]()
+            if rule is None or value is None:
+                continue
+            capacity, rate = rule
+            allowed, tokens = self.store.consume(f'{scope}:{kind}:{value}', capacity, rate)
+            state = (tokens, capacity, rate)
+            if tightest is None or tokens / capacity < tightest[0] / tightest[1]:
+                tightest = state
+            if not allowed:
+                retry_after = (1 - tokens) / rate
+                if blocked is None or retry_after > blocked:
+                    blocked = retry_after
+        g.ratelimit = tightest
+        if blocked is not None:
+            g.ratelimit_retry_after = math.ceil(blocked)
+            abort(429)
+
+    def _add_headers(self, response):
+        state = g.get('ratelimit')
+        if state is not None:
+            tokens, capacity, rate = state
+            response.headers['X-RateLimit-Limit'] = str(capacity)
+            response.headers['X-RateLimit-Remaining'] = str(int(tokens))
+            response.headers['X-RateLimit-Reset'] = str(math.ceil((capacity - tokens) / rate))
+        return response
+
+    def _too_many_requests(self, error):
+        retry_after = g.get('ratelimit_retry_after', 60)
+        response = current_app.make_response((render_template('errors/429.html', retry_after=retry_after), 429))
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+limiter = RateLimiter()
@@ -0,0 +1,217 @@
+"""
+Read Replicas
+Routes the queries of read-only views to replica databases.
+
+Replicas are extra Flask-SQLAlchemy binds named ``replica1``, ``replica2``
+and so on (see DATABASE_REPLICA_URLS in config.py). Views decorated with
+``@read_only`` run their SELECTs on a healthy replica; everything else,
+every write and every SELECT ... FOR UPDATE goes to the primary.
+
+Staleness guard:
+
+* A visitor who wrote anything keeps reading from the primary for
+  REPLICA_READ_YOUR_WRITES seconds, so the booking they just made is on
+  the next page they see. The time of the write is kept in their session.
+* A replica whose replication lag is above REPLICA_MAX_LAG seconds (or that
+  cannot be reached) is skipped until the next lag check.
+
+``with use_primary():`` forces the primary for code that must not read
+stale rows, such as loading the availability index.
+
+With SQLite files standing in for a primary and a replica,
+``flask replicas sync`` copies the primary into every replica.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import click
+from flask import g, has_app_context, has_request_context, session as http_session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+WRITE_AT_KEY = '_db_write_at'
+
+
+def read_only(view):
+    """Allow a view's queries to be answered by a replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """Send every query inside the block to the primary."""
+    if not has_app_context():
+        yield
+        return
+    depth = g.get('db_primary', 0)
+    g.db_primary = depth + 1
+    try:
+        yield
+    finally:
+        g.db_primary = depth
+
+
+def replica_lag(connection):
+    """Replication lag of a replica in seconds, None when replication is stopped.
+
+    Only MySQL reports lag; other databases are treated as up to date.
+    """
+    if connection.dialect.name != 'mysql':
+        return 0
+    for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                              ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')):
+        try:
+            row = connection.execute(text(statement)).mappings().first()
+        except Exception:
+            continue
+        if row is None:
+            return 0  # not configured as a replica
+        return row.get(column)
+    return None
+
+
+class ReplicaRouter:
+    """Chooses the engine for a read and tracks recent writes."""
+
+    def __init__(self, app=None):
+        self.bind_keys = []
+        self.read_your_writes = 5
+        self.max_lag = 10
+        self.lag_check_interval = 5
+        self._health = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.bind_keys = sorted(key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                                if key.startswith('replica'))
+        self.read_your_writes = app.config.get('REPLICA_READ_YOUR_WRITES', 5)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', 10)
+        self.lag_check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', 5)
+        app.extensions['replicas'] = self
+        app.cli.add_command(replicas_cli)
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+
+    def choose(self, session):
+        """Return a replica engine for a read in this session, or None for the primary."""
+        if not self.bind_keys or not has_request_context():
+            return None
+        if not g.get('db_read_only') or g.get('db_primary') or session.info.get('db_wrote'):
+            return None
+        written_at = http_session.get(WRITE_AT_KEY)
+        if written_at and time.time() - written_at < self.read_your_writes:
+            return None
+        engines = session._db.engines
+        healthy = [engines[key] for key in self.bind_keys if self._healthy(key, engines[key])]
+        return random.choice(healthy) if healthy else None
+
+    def _healthy(self, key, engine):
+        now = time.monotonic()
+        checked_at, healthy = self._health.get(key, (None, False))
+        if checked_at is not None and now - checked_at < self.lag_check_interval:
+            return healthy
+        try:
+            with engine.connect() as connection:
+                lag = replica_lag(connection)
+            healthy = lag is not None and lag <= self.max_lag
+        except Exception:
+            healthy = False
+        with self._lock:
+            self._health[key] = (now, healthy)
+        return healthy
+
+    def status(self, engines):
+        """(bind key, url, lag or error) for every replica."""
+        rows = []
+        for key in self.bind_keys:
+            engine = engines[key]
+            try:
+                with engine.connect() as connection:
+                    lag = replica_lag(connection)
+                rows.append((key, engine.url, 'stopped' if lag is None else f'{lag}s behind'))
+            except Exception as e:
+                rows.append((key, engine.url, f'unreachable: {e.__class__.__name__}'))
+        return rows
+
+    # Session event handlers
+
+    def _after_flush(self, session, flush_context):
+        if session.new or session.dirty or session.deleted:
+            session.info['db_wrote'] = True
+
+    def _after_commit(self, session):
+        # db_wrote stays set so later reads in this request use the primary
+        if self.bind_keys and session.info.get('db_wrote') and has_request_context():
+            http_session[WRITE_AT_KEY] = time.time()
+
+
+replicas = ReplicaRouter()
+
+
+class RoutingSession(FlaskSession):
+    """Flask-SQLAlchemy session that sends read-only queries to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) \
+                and getattr(clause, '_for_update_arg', None) is None:
+            engine = replicas.choose(self)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+replicas_cli = AppGroup('replicas', help='Read replica routing.')
+
+
+@replicas_cli.command('status')
+def status_command():
+    """Show the replication lag of every replica."""
+    from flask import current_app
+    router = current_app.extensions['replicas']
+    if not router.bind_keys:
+        click.echo('No replicas configured (DATABASE_REPLICA_URLS).')
+        return
+    for key, url, state in router.status(current_app.extensions['sqlalchemy'].engines):
+        click.echo(f'{key}  {url!r}  {state}')
+
+
+@replicas_cli.command('sync')
+def sync_command():
+    """Copy a SQLite primary into SQLite replicas (local stand-ins only)."""
+    from flask import current_app
+    router = current_app.extensions['replicas']
+    engines = current_app.extensions['sqlalchemy'].engines
+    primary = engines[None]
+    for key in router.bind_keys:
+        replica = engines[key]
+        if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+            click.echo(f'{key}: skipped, only SQLite stand-ins can be synced here')
+            continue
+        sync_sqlite(primary, replica)
+        click.echo(f'{key}: copied from {primary.url.database}')
+
+
+def sync_sqlite(primary, replica):
+    """Overwrite a SQLite replica with the current contents of the primary."""
+    replica.dispose()
+    source = sqlite3.connect(primary.url.database)
+    target = sqlite3.connect(replica.url.database)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
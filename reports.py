@@ -0,0 +1,259 @@
+"""
+Booking Reports
+Rollup tables behind /admin/reports and the admin dashboard.
+
+BookingDailyStat and BookingCarStat hold booking counts and revenue per
+(day, car, status) and per (car, status). They are updated in the same
+transaction as every ORM insert, status change or delete of a Booking, so
+reports read a handful of small rows instead of aggregating the whole
+bookings table. ``flask reports rebuild`` recomputes them from scratch.
+"""
+import time
+from datetime import date
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, func, case
+from sqlalchemy.orm import Session
+
+from cache import MemoryBackend
+from models import db, User, Car, Booking, BookingDailyStat, BookingCarStat
+
+REVENUE_STATUSES = ('approved', 'completed')
+
+# Short-lived cache of the dashboard counters, invalidated by write routes
+_dashboard_cache = MemoryBackend(max_entries=1)
+_dashboard_ttl = 30
+
+
+def _upsert(connection, model, keys, bookings, revenue):
+    """Add deltas to one rollup row, creating it when missing."""
+    table = model.__table__
+    values = dict(keys, bookings=bookings, revenue=revenue)
+    increments = {
+        'bookings': table.c.bookings + bookings,
+        'revenue': table.c.revenue + revenue,
+    }
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(**values).on_duplicate_key_update(**increments)
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**values).on_conflict_do_update(
+            index_elements=list(keys), set_=increments)
+    else:
+        where = [table.c[name] == value for name, value in keys.items()]
+        if connection.execute(table.update().where(*where).values(**increments)).rowcount:
+            return
+        stmt = table.insert().values(**values)
+    connection.execute(stmt)
+
+
+def _booking_day(booking):
+    return booking.booking_date.date() if booking.booking_date else date.today()
+
+
+def _deltas(session):
+    """Yield (day, car_id, status, bookings, revenue) changes from a flush."""
+    for obj in session.new:
+        if isinstance(obj, Booking):
+            yield _booking_day(obj), obj.car_id, obj.status, 1, obj.total_price or 0
+    for obj in session.dirty:
+        if not isinstance(obj, Booking):
+            continue
+        state = inspect(obj)
+        tracked = ('status', 'car_id', 'total_price', 'booking_date')
+        if not any(state.attrs[name].history.has_changes() for name in tracked):
+            continue
+
+        def old(name):
+            history = state.attrs[name].history
+            return history.deleted[0] if history.deleted else getattr(obj, name)
+
+        old_date = old('booking_date')
+        old_day = old_date.date() if old_date else date.today()
+        yield old_day, old('car_id'), old('status'), -1, -(old('total_price') or 0)
+        yield _booking_day(obj), obj.car_id, obj.status, 1, obj.total_price or 0
+    for obj in session.deleted:
+        if isinstance(obj, Booking):
+            yield _booking_day(obj), obj.car_id, obj.status, -1, -(obj.total_price or 0)
+
+
+def _totals(deltas):
+    daily = {}
+    per_car = {}
+    for day, car_id, status, bookings, revenue in deltas:
+        for totals, key in ((daily, (day, car_id, status)), (per_car, (car_id, status))):
+            count, amount = totals.get(key, (0, 0))
+            totals[key] = (count + bookings, amount + revenue)
+    return daily, per_car
+
+
+def _after_flush(session, flush_context):
+    daily, per_car = _totals(_deltas(session))
+    if daily:
+        _write(session.connection(), daily, per_car)
+
+
+def apply_deltas(connection, deltas):
+    """Add (day, car_id, status, bookings, revenue) changes to both rollups.
+
+    For bulk UPDATEs of bookings, which skip the flush hook that normally
+    keeps the rollups current.
+    """
+    daily, per_car = _totals(deltas)
+    if daily:
+        _write(connection, daily, per_car)
+
+
+def _write(connection, daily, per_car):
+    for (day, car_id, status), (bookings, revenue) in daily.items():
+        if bookings or revenue:
+            _upsert(connection, BookingDailyStat,
+                    {'day': day, 'car_id': car_id, 'status': status}, bookings, revenue)
+    for (car_id, status), (bookings, revenue) in per_car.items():
+        if bookings or revenue:
+            _upsert(connection, BookingCarStat,
+                    {'car_id': car_id, 'status': status}, bookings, revenue)
+
+
+def init_app(app):
+    global _dashboard_ttl
+    _dashboard_ttl = app.config.get('DASHBOARD_CACHE_TTL', 30)
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+    app.cli.add_command(reports_cli)
+
+
+def rebuild(connection=None):
+    """Recompute both rollup tables from the bookings table.
+
+    Runs in the current session and commits, or on the given connection
+    inside the caller's transaction.
+    """
+    day = func.date(Booking.booking_date)
+    statements = [
+        BookingDailyStat.__table__.delete(),
+        BookingCarStat.__table__.delete(),
+        BookingDailyStat.__table__.insert().from_select(
+            ['day', 'car_id', 'status', 'bookings', 'revenue'],
+            db.select(day, Booking.car_id, Booking.status,
+                      func.count(Booking.id), func.coalesce(func.sum(Booking.total_price), 0))
+            .group_by(day, Booking.car_id, Booking.status)
+        ),
+        BookingCarStat.__table__.insert().from_select(
+            ['car_id', 'status', 'bookings', 'revenue'],
+            db.select(Booking.car_id, Booking.status,
+                      func.count(Booking.id), func.coalesce(func.sum(Booking.total_price), 0))
+            .group_by(Booking.car_id, Booking.status)
+        ),
+    ]
+    if connection is not None:
+        for statement in statements:
+            connection.execute(statement)
+        return
+    for statement in statements:
+        db.session.execute(statement)
+    db.session.commit()
+    invalidate_dashboard()
+
+
+# Report queries
+
+def daily_bookings(start_date, end_date):
+    """Bookings and revenue per day between two dates (inclusive)."""
+    return db.session.query(
+        BookingDailyStat.day.label('date'),
+        func.sum(BookingDailyStat.bookings).label('count'),
+        func.sum(BookingDailyStat.revenue).label('revenue')
+    ).filter(BookingDailyStat.day.between(start_date, end_date))\
+     .group_by(BookingDailyStat.day)\
+     .having(func.sum(BookingDailyStat.bookings) > 0)\
+     .order_by(BookingDailyStat.day)\
+     .all()
+
+
+def status_summary():
+    """(status, count) for every status that has bookings."""
+    return db.session.query(
+        BookingCarStat.status,
+        func.sum(BookingCarStat.bookings).label('count')
+    ).group_by(BookingCarStat.status)\
+     .having(func.sum(BookingCarStat.bookings) > 0)\
+     .all()
+
+
+def status_counts():
+    """{status: count} over all bookings."""
+    return {status: int(count) for status, count in status_summary()}
+
+
+def popular_cars(limit=5):
+    """Cars with the most bookings: rows of (brand, model, bookings)."""
+    total = func.sum(BookingCarStat.bookings)
+    return db.session.query(
+        Car.brand,
+        Car.model,
+        total.label('bookings')
+    ).join(BookingCarStat, Car.id == BookingCarStat.car_id)\
+     .group_by(Car.id, Car.brand, Car.model)\
+     .having(total > 0)\
+     .order_by(total.desc())\
+     .limit(limit).all()
+
+
+def dashboard_stats():
+    """Dashboard counters, cached for DASHBOARD_CACHE_TTL seconds.
+
+    All five counters come from one statement: a conditional aggregate over
+    cars plus scalar subqueries for customers and the booking rollup.
+    """
+    stats = _dashboard_cache.get('dashboard')
+    if stats is None:
+        stats = query_dashboard_stats()
+        _dashboard_cache.set('dashboard', stats, _dashboard_ttl)
+    return stats
+
+
+def query_dashboard_stats():
+    total_users = db.select(func.count(User.id))\
+        .where(User.is_admin == False).scalar_subquery()
+    total_bookings = db.select(func.coalesce(func.sum(BookingCarStat.bookings), 0))\
+        .scalar_subquery()
+    pending_bookings = db.select(func.coalesce(func.sum(BookingCarStat.bookings), 0))\
+        .where(BookingCarStat.status == 'pending').scalar_subquery()
+    row = db.session.execute(db.select(
+        func.count(Car.id).label('total_cars'),
+        func.coalesce(func.sum(case((Car.is_available == True, 1), else_=0)), 0).label('available_cars'),
+        total_users.label('total_users'),
+        total_bookings.label('total_bookings'),
+        pending_bookings.label('pending_bookings')
+    )).one()
+    return {name: int(value or 0) for name, value in row._mapping.items()}
+
+
+def invalidate_dashboard():
+    """Drop the cached dashboard counters after a car, booking or user change."""
+    _dashboard_cache.clear()
+
+
+def total_revenue():
+    """Revenue from approved and completed bookings."""
+    return db.session.query(func.sum(BookingCarStat.revenue))\
+        .filter(BookingCarStat.status.in_(REVENUE_STATUSES)).scalar() or 0
+
+
+reports_cli = AppGroup('reports', help='Booking report rollups.')
+
+
+@reports_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the report rollup tables from all bookings."""
+    started = time.perf_counter()
+    rebuild()
+    rows = BookingDailyStat.query.count()
+    click.echo(f'Rebuilt {rows} daily rollup rows in {time.perf_counter() - started:.1f}s')
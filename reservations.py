@@ -0,0 +1,100 @@
+"""
+Reservations
+Creates bookings so that two customers can never get overlapping dates on
+the same car, however many book at once.
+
+Checking for a conflict and then inserting is a race: two requests can both
+find the dates free and both insert. Every car has a booking_version, and a
+booking is only written together with a compare-and-set bump of it:
+
+    1. read the car's booking_version (v)
+    2. check the bookings table for an overlapping active booking
+    3. UPDATE cars SET booking_version = v + 1 WHERE id = :car AND booking_version = v
+    4. insert the booking and commit
+
+If another booking of the same car committed after step 1, the UPDATE in
+step 3 matches no row and the attempt starts over, now seeing that booking.
+The UPDATE holds the car's row lock until commit, so bookings of one car
+are ordered while different cars never wait for each other. SQLite, which
+locks the whole database for writes, may instead report the database as
+locked; that is retried the same way.
+"""
+import random
+import time
+
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+
+from models import db, Car, Booking
+from availability import query_conflict
+from pricing import pricing
+from replicas import use_primary
+
+
+class BookingConflict(Exception):
+    """The dates overlap an active booking of the car."""
+
+    def __init__(self, booking_id):
+        super().__init__(f'dates overlap booking {booking_id}')
+        self.booking_id = booking_id
+
+
+class BookingBusy(Exception):
+    """The car kept being booked by others; give up after the retries."""
+
+
+def _claim(car_id, version):
+    """Bump the car's booking_version if it is still version. True on success."""
+    result = db.session.execute(
+        db.update(Car)
+        .where(Car.id == car_id, Car.booking_version == version)
+        # Keep updated_at: a booking does not change the car's catalog data
+        .values(booking_version=Car.booking_version + 1, updated_at=Car.updated_at)
+    )
+    return result.rowcount == 1
+
+
+def reserve(user_id, car_id, start_date, end_date, notes=None, max_retries=None, backoff=None):
+    """Insert and commit a pending booking. Returns it.
+
+    Raises BookingConflict when the dates are taken, BookingBusy when the
+    car's version kept changing for max_retries attempts, and the usual
+    NoResultFound when there is no such car.
+    """
+    config = current_app.config
+    max_retries = config.get('BOOKING_MAX_RETRIES', 5) if max_retries is None else max_retries
+    backoff = config.get('BOOKING_RETRY_BACKOFF', 0.01) if backoff is None else backoff
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            # Random backoff spreads out requests that lost the same race
+            time.sleep(random.uniform(0, backoff * 2 ** (attempt - 1)))
+        try:
+            with use_primary():
+                price_per_day, category, version = db.session.query(
+                    Car.price_per_day, Car.category, Car.booking_version
+                ).filter(Car.id == car_id).one()
+                conflict = query_conflict(car_id, start_date, end_date)
+                if conflict is not None:
+                    db.session.rollback()
+                    raise BookingConflict(conflict)
+                if not _claim(car_id, version):
+                    db.session.rollback()
+                    continue
+                booking = Booking(
+                    user_id=user_id,
+                    car_id=car_id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    total_days=(end_date - start_date).days,
+                    total_price=pricing.quote(price_per_day, category, start_date, end_date),
+                    notes=notes
+                )
+                db.session.add(booking)
+                db.session.commit()
+                return booking
+        except OperationalError as e:
+            # Lock timeouts, deadlocks and SQLite's "database is locked"
+            db.session.rollback()
+            current_app.logger.warning('Booking car %s, attempt %d: %s', car_id, attempt + 1, e.orig)
+    raise BookingBusy(f'car {car_id} is busy, gave up after {max_retries + 1} attempts')
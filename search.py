@@ -0,0 +1,222 @@
+"""
+Car Search
+Text search for the /cars catalog.
+
+On MySQL with the ft_cars_search FULLTEXT index the database does the
+matching and ranking (MATCH ... AGAINST in boolean mode). Everywhere else
+an in-memory inverted index over brand, model, category and description
+answers the query with prefix matching and field-weighted relevance, and
+the catalog query only has to fetch the matching ids.
+"""
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from sqlalchemy import case, event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from models import db, Car
+
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+STOP_WORDS = frozenset(('a', 'an', 'and', 'the', 'for', 'or', 'of', 'with', 'to', 'in'))
+
+# Relevance weight of a term found in each field
+FIELD_WEIGHTS = (('brand', 3.0), ('model', 3.0), ('category', 2.0), ('description', 1.0))
+# A term matching a whole token scores more than one matching only a prefix
+EXACT_BONUS = 1.5
+
+FULLTEXT_INDEX = 'ft_cars_search'
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall((text or '').lower()) if t not in STOP_WORDS]
+
+
+class InvertedIndex:
+    """Token -> {car_id: weight} postings with a sorted vocabulary for prefix lookups."""
+
+    def __init__(self):
+        self._postings = {}
+        self._docs = {}
+        self._vocabulary = []
+        self._dirty = False
+        self.built_at = 0.0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, car_id, fields):
+        self.remove(car_id)
+        weights = {}
+        for name, weight in FIELD_WEIGHTS:
+            for token in tokenize(fields.get(name)):
+                weights[token] = weights.get(token, 0.0) + weight
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._dirty = True
+            postings[car_id] = weight
+        self._docs[car_id] = tuple(weights)
+
+    def remove(self, car_id):
+        for token in self._docs.pop(car_id, ()):
+            postings = self._postings[token]
+            postings.pop(car_id, None)
+            if not postings:
+                del self._postings[token]
+                self._dirty = True
+
+    def _expand(self, term):
+        """Yield (token, exact) for every indexed token starting with term."""
+        if self._dirty:
+            self._vocabulary = sorted(self._postings)
+            self._dirty = False
+        vocabulary = self._vocabulary
+        i = bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            yield vocabulary[i], vocabulary[i] == term
+            i += 1
+
+    def search(self, text, limit=None):
+        """Return car ids matching every term of text, best match first."""
+        terms = tokenize(text)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token, exact in self._expand(term):
+                bonus = EXACT_BONUS if exact else 1.0
+                for car_id, weight in self._postings[token].items():
+                    weight *= bonus
+                    if weight > term_scores.get(car_id, 0.0):
+                        term_scores[car_id] = weight
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {car_id: score + term_scores[car_id]
+                          for car_id, score in scores.items() if car_id in term_scores}
+            if not scores:
+                return []
+        key = lambda car_id: (-scores[car_id], car_id)
+        if limit and limit < len(scores):
+            return heapq.nsmallest(limit, scores, key=key)
+        return sorted(scores, key=key)
+
+
+def _car_fields(car):
+    return {name: getattr(car, name) for name, _ in FIELD_WEIGHTS}
+
+
+class CarSearch:
+    """Chooses the search backend and keeps the in-memory index current."""
+
+    def __init__(self, app=None):
+        self.backend = 'auto'
+        self.ttl = None
+        self.max_results = 1000
+        self._index = None
+        self._use_fulltext = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = app.config.get('SEARCH_BACKEND', 'auto')
+        self.ttl = app.config.get('SEARCH_INDEX_TTL')
+        self.max_results = app.config.get('SEARCH_MAX_RESULTS', 1000)
+        app.extensions['car_search'] = self
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def use_fulltext(self):
+        if self._use_fulltext is None:
+            if self.backend in ('fulltext', 'auto') and db.engine.dialect.name == 'mysql':
+                indexes = sa_inspect(db.engine).get_indexes(Car.__tablename__)
+                self._use_fulltext = any(ix['name'] == FULLTEXT_INDEX for ix in indexes)
+            else:
+                self._use_fulltext = False
+        return self._use_fulltext
+
+    def filter(self, query, text):
+        """Restrict a Car query to matches for text, ordered by relevance."""
+        if self.backend == 'like':
+            pattern = f'%{text}%'
+            return query.filter(db.or_(
+                Car.brand.ilike(pattern),
+                Car.model.ilike(pattern),
+                Car.description.ilike(pattern)
+            ))
+
+        if self.use_fulltext():
+            from sqlalchemy.dialects.mysql import match
+            terms = ' '.join(f'+{t}*' for t in tokenize(text))
+            if not terms:
+                return query
+            relevance = match(Car.brand, Car.model, Car.description, against=terms).in_boolean_mode()
+            return query.filter(relevance).order_by(relevance.desc())
+
+        if not tokenize(text):
+            return query
+        index = self.index()
+        with self._lock:
+            ids = index.search(text)
+        if len(ids) > self.max_results:
+            # Too many ids for one IN list: apply the query's other filters
+            # first, so the cap only drops matches the page could never show
+            allowed = {car_id for (car_id,) in query.with_entities(Car.id).order_by(None)}
+            ids = [car_id for car_id in ids if car_id in allowed][:self.max_results]
+        if not ids:
+            return query.filter(db.false())
+        rank = case({car_id: position for position, car_id in enumerate(ids)}, value=Car.id)
+        return query.filter(Car.id.in_(ids)).order_by(rank)
+
+    def index(self):
+        """Return the in-memory index, building it on first use or after the TTL."""
+        index = self._index
+        if index is None or (self.ttl is not None and time.monotonic() - index.built_at > self.ttl):
+            index = self.rebuild()
+        return index
+
+    def rebuild(self):
+        index = InvertedIndex()
+        columns = [getattr(Car, name) for name, _ in FIELD_WEIGHTS]
+        for row in db.session.query(Car.id, *columns):
+            index.add(row[0], dict(zip((name for name, _ in FIELD_WEIGHTS), row[1:])))
+        index.built_at = time.monotonic()
+        with self._lock:
+            self._index = index
+        return index
+
+    # Session event handlers
+
+    def _after_flush(self, session, flush_context):
+        changes = session.info.setdefault('search_changes', {})
+        for obj in session.new.union(session.dirty):
+            if isinstance(obj, Car):
+                changes[obj.id] = _car_fields(obj)
+        for obj in session.deleted:
+            if isinstance(obj, Car):
+                changes[obj.id] = None
+
+    def _after_commit(self, session):
+        changes = session.info.pop('search_changes', None)
+        if not changes or self._index is None:
+            return
+        with self._lock:
+            for car_id, fields in changes.items():
+                if fields is None:
+                    self._index.remove(car_id)
+                else:
+                    self._index.add(car_id, fields)
+
+    def _after_rollback(self, session):
+        session.info.pop('search_changes', None)
+
+
+car_search = CarSearch()
@@ -47,6 +47,128 @@
         }
     }
 
+    // Availability calendar: grey out the days this car is already booked
+    const calendarEl = document.getElementById('availabilityCalendar');
+    if (calendarEl && startDateInput && endDateInput) {
+        const DAY_MS = 24 * 60 * 60 * 1000;
+        let calendar = null;
+        let monthOffset = 0;
+
+        const toDate = value => new Date(value + 'T00:00:00Z');
+        const toValue = day => day.toISOString().split('T')[0];
+
+        function isBooked(day) {
+            const i = Math.round((day - calendar.start) / DAY_MS);
+            if (i < 0 || i >= calendar.days) {
+                return false;
+            }
+            return (calendar.booked[i >> 3] & (1 << (i & 7))) !== 0;
+        }
+
+        function rangeIsFree(start, end) {
+            for (let day = start; day <= end; day = new Date(day.getTime() + DAY_MS)) {
+                if (isBooked(day)) {
+                    return false;
+                }
+            }
+            return true;
+        }
+
+        function checkRange() {
+            let message = '';
+            if (calendar && startDateInput.value && endDateInput.value &&
+                    !rangeIsFree(toDate(startDateInput.value), toDate(endDateInput.value))) {
+                message = 'Some of the selected days are already booked.';
+            }
+            endDateInput.setCustomValidity(message);
+            const note = calendarEl.querySelector('.calendar-note');
+            if (note) {
+                note.textContent = message;
+            }
+        }
+
+        function pickDay(value) {
+            if (!startDateInput.value || endDateInput.value || value <= startDateInput.value) {
+                startDateInput.value = value;
+                endDateInput.value = '';
+                endDateInput.min = value;
+            } else {
+                endDateInput.value = value;
+            }
+            checkRange();
+            render();
+        }
+
+        function render() {
+            const first = new Date(Date.UTC(calendar.start.getUTCFullYear(),
+                                            calendar.start.getUTCMonth() + monthOffset, 1));
+            const last = new Date(calendar.start.getTime() + (calendar.days - 1) * DAY_MS);
+            const next = new Date(Date.UTC(first.getUTCFullYear(), first.getUTCMonth() + 1, 1));
+            const title = first.toLocaleDateString(undefined, { month: 'long', year: 'numeric', timeZone: 'UTC' });
+
+            let html = '<div class="d-flex justify-content-between align-items-center mb-2">' +
+                '<button type="button" class="btn btn-sm btn-outline-secondary" data-move="-1"' +
+                (monthOffset === 0 ? ' disabled' : '') + '>&lsaquo;</button>' +
+                '<strong>' + title + '</strong>' +
+                '<button type="button" class="btn btn-sm btn-outline-secondary" data-move="1"' +
+                (next > last ? ' disabled' : '') + '>&rsaquo;</button></div>' +
+                '<div class="calendar-grid">';
+            ['Su', 'Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa'].forEach(name => {
+                html += '<span class="calendar-weekday">' + name + '</span>';
+            });
+            for (let i = 0; i < first.getUTCDay(); i++) {
+                html += '<span></span>';
+            }
+            for (let day = first; day < next; day = new Date(day.getTime() + DAY_MS)) {
+                const value = toValue(day);
+                let state = 'free';
+                if (day < calendar.start || day > last) {
+                    state = 'past';
+                } else if (isBooked(day)) {
+                    state = 'booked';
+                }
+                const selected = startDateInput.value && value >= startDateInput.value &&
+                    value <= (endDateInput.value || startDateInput.value);
+                html += '<button type="button" class="calendar-day ' + state + (selected ? ' selected' : '') +
+                    '" data-day="' + value + '"' + (state === 'free' ? '' : ' disabled') +
+                    ' title="' + (state === 'booked' ? 'Booked' : value) + '">' + day.getUTCDate() + '</button>';
+            }
+            html += '</div><small class="calendar-legend text-muted">' +
+                '<span class="calendar-swatch booked"></span> Booked</small>' +
+                '<div class="calendar-note text-danger small"></div>';
+            calendarEl.innerHTML = html;
+            checkRange();
+        }
+
+        calendarEl.addEventListener('click', function(e) {
+            const button = e.target.closest('button');
+            if (!button || button.disabled) {
+                return;
+            }
+            if (button.dataset.move) {
+                monthOffset += parseInt(button.dataset.move, 10);
+                render();
+            } else if (button.dataset.day) {
+                pickDay(button.dataset.day);
+            }
+        });
+        startDateInput.addEventListener('change', () => calendar && render());
+        endDateInput.addEventListener('change', () => calendar && render());
+
+        fetch(calendarEl.dataset.calendarUrl)
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(payload => {
+                const data = payload.data;
+                calendar = {
+                    start: toDate(data.start),
+                    days: data.days,
+                    booked: Uint8Array.from(atob(data.booked), c => c.charCodeAt(0))
+                };
+                render();
+            })
+            .catch(() => calendarEl.remove());
+    }
+
     // Confirm delete actions
     const deleteForms = document.querySelectorAll('form[action*="delete"]');
     deleteForms.forEach(form => {